@@ -0,0 +1,121 @@
+import collections
+import itertools
+import threading
+import time
+import numpy as np
+from detection import SURROUNDED_MIN_MALES, COVERAGE_WARNING_RATIO, COVERAGE_FULL_RATIO
+
+# Per-frame values kept in the ring buffer
+HISTORY_DTYPE = np.dtype([
+    ("time", np.float64),
+    ("num_persons", np.int16),
+    ("num_males", np.int16),
+    ("num_females", np.int16),
+    ("coverage_ratio", np.float32),
+])
+
+
+class AlertRule:
+    """
+    A debounced alert condition. condition maps a block of history rows to a
+    boolean array. The rule raises once at least raise_fraction of the frames
+    in the last `window` seconds match and keeps doing so for min_duration
+    seconds; it clears once no more than clear_fraction match for
+    clear_duration seconds. The gap between the two fractions is the
+    hysteresis that stops a single misclassified frame from toggling it.
+    """
+
+    def __init__(self, name, message, condition, window=2.0, raise_fraction=0.7, clear_fraction=0.3,
+                 min_duration=1.0, clear_duration=2.0):
+        self.name = name
+        self.message = message
+        self.condition = condition
+        self.window = window
+        self.raise_fraction = raise_fraction
+        self.clear_fraction = clear_fraction
+        self.min_duration = min_duration
+        self.clear_duration = clear_duration
+
+
+# The warnings of DetectionPipeline.analyze, as debounced alerts
+DEFAULT_RULES = (
+    AlertRule("woman_surrounded", "Woman is surrounded by men",
+              lambda h: (h["num_females"] == 1) & (h["num_males"] >= SURROUNDED_MIN_MALES)),
+    AlertRule("camera_covered", "Screen covered over 40%",
+              lambda h: h["coverage_ratio"] >= COVERAGE_WARNING_RATIO),
+    AlertRule("camera_fully_covered", "100% display is covered",
+              lambda h: h["coverage_ratio"] >= COVERAGE_FULL_RATIO),
+)
+
+
+class AlertEngine:
+    """
+    Turns per-frame detection info into discrete alert events with start and
+    end times. Recent frames live in a fixed-size ring buffer and only the
+    last max_events events are kept, so memory per camera is constant.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, capacity=512, max_events=100):
+        self.rules = rules
+        self.history = np.zeros(capacity, dtype=HISTORY_DTYPE)
+        self.size = 0
+        self.index = 0
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # Per rule: time the raise (or clear) condition started to hold
+        self.pending = {rule.name: None for rule in rules}
+        # Per rule: time of the first matching frame in the window that
+        # reached raise_fraction, i.e. when the alerting situation began
+        self.onset = {rule.name: None for rule in rules}
+        self.active = {}
+        self.events = collections.deque(maxlen=max_events)
+
+    def _window(self, now, seconds):
+        rows = self.history[:self.size]
+        return rows[rows["time"] >= now - seconds]
+
+    def update(self, detection_info, now=None):
+        """Record one frame and return the list of currently active alerts"""
+        now = time.time() if now is None else now
+        with self.lock:
+            row = self.history[self.index]
+            row["time"] = now
+            for field in ("num_persons", "num_males", "num_females", "coverage_ratio"):
+                row[field] = detection_info.get(field, 0)
+            self.index = (self.index + 1) % len(self.history)
+            self.size = min(self.size + 1, len(self.history))
+
+            for rule in self.rules:
+                window = self._window(now, rule.window)
+                matches = rule.condition(window)
+                fraction = float(np.mean(matches)) if len(window) else 0.0
+                active = self.active.get(rule.name)
+                holding = fraction <= rule.clear_fraction if active else fraction >= rule.raise_fraction
+                if not holding:
+                    self.pending[rule.name] = None
+                    continue
+                since = self.pending[rule.name]
+                if since is None:
+                    since = self.pending[rule.name] = now
+                    if active is None:
+                        self.onset[rule.name] = float(window["time"][matches][0])
+                if active is None and now - since >= rule.min_duration:
+                    # The alert started when its condition first held, not
+                    # when the debounce let it through
+                    event = {"id": next(self.ids), "type": rule.name, "message": rule.message,
+                             "start": self.onset[rule.name], "end": None}
+                    self.active[rule.name] = event
+                    self.events.append(event)
+                    self.pending[rule.name] = None
+                elif active is not None and now - since >= rule.clear_duration:
+                    # The alert ended when the window first dropped to clear_fraction
+                    active["end"] = since
+                    del self.active[rule.name]
+                    self.pending[rule.name] = None
+            return [dict(event) for event in self.active.values()]
+
+    def recent(self, limit=None):
+        """Return the most recent events, newest first, including ended ones"""
+        with self.lock:
+            events = [dict(event) for event in reversed(self.events)]
+        return events[:limit] if limit else events
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from models import load_models
+from safenest import DetectionPipeline, options_from_env
+
+# Fields written for every frame, the same ones /detection_info serves
+OUTPUT_FIELDS = ("num_persons", "num_males", "num_females", "status", "coverage_ratio")
+
+processor = None
+
+
+def init_worker(options):
+    """Load the nets once per worker process"""
+    global processor
+    cv2.setNumThreads(1)
+    faceNet, genderNet = load_models()
+    processor = DetectionPipeline(faceNet, genderNet, **options)
+
+
+def split_segments(frame_count, num_segments):
+    """Split [0, frame_count) into num_segments contiguous (start, end) ranges"""
+    num_segments = max(1, min(num_segments, frame_count))
+    step = -(-frame_count // num_segments)
+    return [(start, min(start + step, frame_count)) for start in range(0, frame_count, step)]
+
+
+def analyze_segment(video_path, start, end, stride, fps, part_path):
+    """Analyze frames [start, end) of the video and write them as JSON lines to part_path"""
+    video = cv2.VideoCapture(video_path)
+    video.set(cv2.CAP_PROP_POS_FRAMES, start)
+    processor.reset()
+    processed = 0
+    with open(part_path, 'w') as out:
+        for index in range(start, end):
+            if index % stride:
+                # Skipped frames are grabbed but never decoded
+                if not video.grab():
+                    break
+                continue
+            ret, frame = video.read()
+            if not ret:
+                break
+            timestamp = index / fps
+            _, _, detection_info = processor.analyze(frame, now=timestamp)
+            record = {"frame": index, "timestamp": round(timestamp, 3)}
+            record.update((field, detection_info[field]) for field in OUTPUT_FIELDS)
+            out.write(json.dumps(record) + "\n")
+            processed += 1
+    video.release()
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a recorded video and write one JSON line per frame')
+    parser.add_argument('video', help='Path to the video file')
+    parser.add_argument('--output', '-o', help='Output JSONL file (default: stdout)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--segments', type=int, help='Number of segments (default: 4 per worker)')
+    parser.add_argument('--stride', type=int, default=1, help='Analyze every Nth frame')
+    parser.add_argument('--gender-cache-ttl', type=float,
+                        help='Seconds a tracked face keeps its gender (default: GENDER_CACHE_TTL or 2)')
+    parser.add_argument('--motion-sensitivity', type=float,
+                        help='Reuse the previous result when less than this fraction of pixels changed '
+                             '(default: MOTION_SENSITIVITY or 0 = off)')
+    args = parser.parse_args()
+
+    video = cv2.VideoCapture(args.video)
+    if not video.isOpened():
+        print(f"Error: Could not open video {args.video}", file=sys.stderr)
+        sys.exit(1)
+    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = video.get(cv2.CAP_PROP_FPS) or 25.0
+    video.release()
+    if frame_count <= 0:
+        print("Error: Could not determine the frame count of the video", file=sys.stderr)
+        sys.exit(1)
+
+    # The same environment options as every other entry point; flags override them
+    options = options_from_env()
+    if args.gender_cache_ttl is not None:
+        options["gender_cache_ttl"] = args.gender_cache_ttl
+    if args.motion_sensitivity is not None:
+        options["motion_sensitivity"] = args.motion_sensitivity
+    segments = split_segments(frame_count, args.segments or args.workers * 4)
+    stride = max(1, args.stride)
+
+    t = time.time()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        part_paths = [os.path.join(tmp_dir, f"part{i:05d}.jsonl") for i in range(len(segments))]
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(options,)) as pool:
+            futures = [pool.submit(analyze_segment, args.video, start, end, stride, fps, part_path)
+                       for (start, end), part_path in zip(segments, part_paths)]
+            processed = sum(future.result() for future in futures)
+
+        # Segments finish out of order; concatenate them in frame order
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for part_path in part_paths:
+                with open(part_path) as part:
+                    for line in part:
+                        out.write(line)
+        finally:
+            if args.output:
+                out.close()
+
+    elapsed = time.time() - t
+    print(f"Analyzed {processed} frames in {elapsed:.1f}s "
+          f"({processed / max(elapsed, 1e-6):.1f} fps, video is {fps:.1f} fps)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
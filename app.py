@@ -1,6 +1,7 @@
-from flask import Flask, Response, send_from_directory, jsonify
+from flask import Flask, Response, send_from_directory, jsonify, request
 import cv2
-from stream_server import get_camera
+from stream_server import get_camera, generate_detection_events
+from pipeline import MJPEG_PART_HEADER
 
 app = Flask(__name__, static_folder='.')
 camera = None
@@ -16,13 +17,17 @@ def index():
     return send_from_directory('.', 'index.html')
 
 def gen(camera):
+    sequence = 0
     while True:
-        frame, detection_info = camera.get_frame()
+        sequence, frame, detection_info = camera.wait_for_frame(sequence)
         if frame is not None:
             # Store the latest detection info
             app.detection_info = detection_info
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
+            yield MJPEG_PART_HEADER
+            yield frame
+            yield b'\r\n\r\n'
+        elif not camera.running:
+            break
 
 @app.route('/video_feed')
 def video_feed():
@@ -32,6 +37,15 @@ def video_feed():
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
+@app.route('/detection_stream')
+def detection_stream():
+    get_camera_instance()
+    response = Response(generate_detection_events(),
+                    mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
 @app.route('/detection_info')
 def detection_info():
     response = jsonify(getattr(app, 'detection_info', {
@@ -45,5 +59,18 @@ def detection_info():
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
+@app.route('/history')
+def history():
+    camera = get_camera_instance()
+    try:
+        response = jsonify(camera.history.query(request.args.get('from', type=float),
+                                                request.args.get('to', type=float),
+                                                request.args.get('step', type=float)))
+    except ValueError as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 400
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
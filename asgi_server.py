@@ -0,0 +1,215 @@
+"""
+Asyncio (ASGI) server mode: serves the index page, /video_feed and
+/detection_info for many concurrent viewers from a single event loop, e.g.
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 8000
+
+Cameras, models and configuration are shared with stream_server.
+"""
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import parse_qs
+import stream_server
+from pipeline import DEFAULT_DETECTION_INFO, MJPEG_PART_HEADER, normalize_tier
+
+# Seconds a client may take to accept one frame before it is disconnected
+SEND_TIMEOUT = float(os.environ.get('ASGI_SEND_TIMEOUT', 10.0))
+
+
+class FrameHub:
+    """
+    Bridges one camera pipeline to the event loop. A single thread per
+    camera waits on the pipeline and wakes every subscribed coroutine through
+    a future, so connections cost no thread of their own. The default JPEG
+    tier is only encoded here while some subscriber is watching it.
+    """
+
+    def __init__(self, camera, loop):
+        self.camera = camera
+        self.loop = loop
+        self.sequence = 0
+        self.frame = None
+        self.frame_bytes = None
+        # Subscribers of the default tier; only touched on the event loop
+        self.default_viewers = 0
+        self.next = loop.create_future()
+        self.thread = threading.Thread(target=self._run, name=f"frame-hub-{camera.name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        sequence = 0
+        try:
+            while True:
+                sequence, detection_info = self.camera.wait_for_info(sequence)
+                if detection_info is None:
+                    if not self.camera.running:
+                        break
+                    continue
+                frame = self.camera.frame
+                # The default tier is encoded here, off the event loop, but
+                # only if someone watches it; custom tiers are encoded by the
+                # streams that asked for them
+                frame_bytes = frame.get() if self.default_viewers else None
+                self.loop.call_soon_threadsafe(self._publish, sequence, frame, frame_bytes)
+            # Wake the subscribers so they notice the camera stopped
+            self.loop.call_soon_threadsafe(self._publish, self.sequence, self.frame, self.frame_bytes)
+        except RuntimeError:
+            # The event loop was closed
+            pass
+
+    def _publish(self, sequence, frame, frame_bytes):
+        self.sequence, self.frame, self.frame_bytes = sequence, frame, frame_bytes
+        waiter, self.next = self.next, self.loop.create_future()
+        waiter.set_result(None)
+
+    async def wait(self, last_sequence, timeout=1.0):
+        """Wait until a frame newer than last_sequence is available"""
+        if self.sequence == last_sequence:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.next), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.sequence
+
+    def alive(self):
+        return self.thread.is_alive()
+
+
+hubs = {}
+
+
+async def get_hub(cam_id):
+    """Return the FrameHub of a camera, starting the camera on first use"""
+    loop = asyncio.get_running_loop()
+    # Starting a camera may open a device or spawn a worker process
+    camera = await loop.run_in_executor(None, stream_server.get_camera, cam_id)
+    hub = hubs.get(camera.name)
+    if hub is None or not hub.alive():
+        hub = hubs[camera.name] = FrameHub(camera, loop)
+    return hub
+
+
+async def send_response(send, status, body, content_type):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_frames(send, receive, cam_id, quality, width):
+    """
+    Multipart MJPEG stream with per-client backpressure: a client has at
+    most one frame in flight, and send() only returns once the server has
+    room to buffer it. A slow client therefore skips to the newest frame
+    instead of queueing old ones, and one that stalls for SEND_TIMEOUT is
+    dropped.
+    """
+    try:
+        hub = await get_hub(cam_id)
+    except KeyError:
+        await send_response(send, 404, b"Unknown camera", "text/plain")
+        return
+    loop = asyncio.get_running_loop()
+    custom_tier = normalize_tier(quality, width) != (None, None)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    metrics = hub.camera.metrics
+    metrics.viewer_connected()
+    if not custom_tier:
+        hub.default_viewers += 1
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"multipart/x-mixed-replace; boundary=frame"),
+                                (b"cache-control", b"no-cache")]})
+        sequence = 0
+        while not disconnected.done():
+            new_sequence = await hub.wait(sequence)
+            if new_sequence == sequence:
+                if not hub.alive():
+                    break
+                continue
+            sequence = new_sequence
+            frame_bytes = None if custom_tier else hub.frame_bytes
+            if frame_bytes is None and hub.frame is not None:
+                # A custom tier, or the default one before the hub encoded it
+                frame_bytes = await loop.run_in_executor(None, hub.frame.get, quality, width)
+            if frame_bytes is None:
+                continue
+            for chunk in (MJPEG_PART_HEADER, frame_bytes, b'\r\n'):
+                await asyncio.wait_for(send({"type": "http.response.body", "body": chunk, "more_body": True}),
+                                       SEND_TIMEOUT)
+        await send({"type": "http.response.body", "body": b""})
+    except (asyncio.TimeoutError, OSError):
+        pass
+    finally:
+        disconnected.cancel()
+        metrics.viewer_disconnected()
+        if not custom_tier:
+            hub.default_viewers -= 1
+
+
+index_page = None
+
+
+def render_index():
+    """Render the index template of stream_server once"""
+    global index_page
+    if index_page is None:
+        with stream_server.app.test_request_context('/'):
+            index_page = stream_server.index().encode()
+    return index_page
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            threading.Thread(target=stream_server.warm_up, name="warm-up", daemon=True).start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            stream_server.cleanup()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if scope["method"] not in ("GET", "HEAD"):
+        await send_response(send, 405, b"Method Not Allowed", "text/plain")
+        return
+
+    parts = scope["path"].strip("/").split("/")
+    cam_id = parts[1] if len(parts) == 2 else None
+    query = parse_qs(scope.get("query_string", b"").decode())
+
+    def int_arg(name):
+        value = query.get(name, [None])[0]
+        return int(value) if value and value.isdigit() else None
+
+    if parts == [""]:
+        await send_response(send, 200, render_index(), "text/html; charset=utf-8")
+    elif parts[0] == "video_feed" and len(parts) <= 2:
+        await stream_frames(send, receive, cam_id, int_arg("quality"), int_arg("width"))
+    elif parts[0] == "detection_info" and len(parts) <= 2:
+        try:
+            camera = stream_server.peek_camera(cam_id)
+        except KeyError:
+            await send_response(send, 404, b"Unknown camera", "text/plain")
+            return
+        info = camera.get_info() if camera is not None else DEFAULT_DETECTION_INFO
+        await send_response(send, 200, json.dumps(info).encode(), "application/json")
+    elif parts == ["ready"]:
+        state = dict(stream_server.startup_state, ready=stream_server.is_ready())
+        await send_response(send, 200 if state["ready"] else 503, json.dumps(state).encode(), "application/json")
+    else:
+        await send_response(send, 404, b"Not Found", "text/plain")
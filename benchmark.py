@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from models import load_models, current_dnn_config
+from detection import detect_faces, classify_genders, coverage_map, TiledFaceDetector, MAX_GENDER_BATCH
+from safenest import DetectionPipeline
+from pipeline import encode_jpeg
+from cameras import IMAGE_EXTENSIONS
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+FACE_COUNTS = (0, 1, 4, 8)
+
+
+def percentile_stats(samples):
+    """Return latency percentiles in milliseconds and throughput for a list of seconds"""
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "runs": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_fps": round(1000.0 / float(ms.mean()), 2) if ms.mean() > 0 else None,
+    }
+
+
+def time_stage(fn, runs, warmup=3, setup=None):
+    """Time fn() runs times; setup(), if given, runs untimed before every call"""
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    samples = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentile_stats(samples)
+
+
+def synthetic_frame(width, height, seed=0):
+    """Textured frame so coverage and JPEG costs resemble a real camera"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 255, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    return cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def synthetic_boxes(width, height, count):
+    """Evenly spaced face-sized boxes"""
+    size = max(32, min(width, height) // 6)
+    boxes = []
+    for i in range(count):
+        x = (i * (size + 10)) % max(1, width - size)
+        y = ((i * (size + 10)) // max(1, width - size)) * (size + 10) % max(1, height - size)
+        boxes.append([x, y, x + size, y + size])
+    return boxes
+
+
+def capture_stats(frame, runs):
+    """Time cap.read() on an MJPEG file made from the frame"""
+    height, width = frame.shape[:2]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "capture.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (width, height))
+        for _ in range(runs + 3):
+            writer.write(frame)
+        writer.release()
+        capture = cv2.VideoCapture(path)
+        stats = time_stage(capture.read, runs)
+        capture.release()
+    return stats
+
+
+def bench_frame(frame, nets, runs, face_counts):
+    height, width = frame.shape[:2]
+    results = {"capture": capture_stats(frame, runs)}
+    faceNet, genderNet = nets if nets else (None, None)
+    # Stages that draw in place work on a scratch copy, refreshed outside
+    # the timed call so the copy is not part of the measurement
+    scratch = np.empty_like(frame)
+
+    def reset_scratch():
+        np.copyto(scratch, frame)
+
+    if faceNet is not None:
+        results["detect"] = time_stage(lambda: detect_faces(faceNet, frame), runs)
+        if max(width, height) > 600:
+            tiled_detector = TiledFaceDetector(600)
+            results["detect_tiled_600"] = time_stage(lambda: tiled_detector(faceNet, frame), runs)
+    for count in face_counts:
+        boxes = synthetic_boxes(width, height, count)
+        if genderNet is not None and count:
+            results[f"gender_{count}_faces"] = time_stage(
+                lambda: classify_genders(genderNet, frame, boxes, 20, MAX_GENDER_BATCH), runs)
+        info = {"num_persons": count, "num_males": count, "num_females": 0,
+                "status": "Multiple persons detected", "coverage_status": "Coverage: 0.00"}
+        genders = ['Male'] * count
+        results[f"overlay_{count}_faces"] = time_stage(
+            lambda: DetectionPipeline.render(scratch, boxes, genders, info), runs, setup=reset_scratch)
+    results["coverage_3x3"] = time_stage(lambda: coverage_map(frame, 3, 3), runs)
+    results["coverage_8x8"] = time_stage(lambda: coverage_map(frame, 8, 8), runs)
+    results["encode"] = time_stage(lambda: encode_jpeg(frame), runs)
+    if nets:
+        # The frame repeats, so tracked faces hit the gender cache on every
+        # run after the first; the uncached run pays for classification
+        processor = DetectionPipeline(faceNet, genderNet)
+        results["full_frame"] = time_stage(lambda: processor(scratch), runs, setup=reset_scratch)
+        processor = DetectionPipeline(faceNet, genderNet, gender_cache_ttl=0)
+        results["full_frame_uncached"] = time_stage(lambda: processor(scratch), runs, setup=reset_scratch)
+    return results
+
+
+def import_stats(module, runs):
+    """Time a cold import of module in fresh interpreters"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=Path(__file__).parent)
+        samples.append(float(output.decode().split()[0]))
+    return percentile_stats(samples)
+
+
+def print_comparison(report, baseline):
+    """Print the p50 change of every stage present in both reports"""
+    print(f"\nChange in p50 against {baseline.get('revision') or 'baseline'}")
+    for case, stages in report["results"].items():
+        for stage, stats in stages.items():
+            old = baseline.get("results", {}).get(case, {}).get(stage)
+            if old and old["p50_ms"] > 0:
+                change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100.0
+                print(f"  {case}/{stage:<20} {old['p50_ms']:8.2f} -> {stats['p50_ms']:8.2f} ms ({change:+.1f}%)")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=Path(__file__).parent, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the detection pipeline')
+    parser.add_argument('--runs', type=int, default=50, help='Timed runs per stage')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help='Comma separated list of ' + ', '.join(RESOLUTIONS))
+    parser.add_argument('--faces', default=','.join(map(str, FACE_COUNTS)),
+                        help='Comma separated face counts for the gender and overlay stages')
+    parser.add_argument('--import-runs', type=int, default=5, help='Cold imports of stream_server to time')
+    parser.add_argument('--images', help='Directory of sample images to benchmark as well')
+    parser.add_argument('--output', '-o', default='benchmark.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    try:
+        nets = load_models()
+    except Exception as e:
+        print(f"Models unavailable, skipping DNN stages: {e}")
+        nets = None
+    face_counts = [int(n) for n in args.faces.split(',') if n]
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "runs": args.runs,
+        "dnn": current_dnn_config(),
+        "results": {},
+    }
+    if args.import_runs:
+        print("Benchmarking stream_server import time...")
+        report["results"]["startup"] = {"import_stream_server": import_stats("stream_server", args.import_runs)}
+    for name in args.resolutions.split(','):
+        width, height = RESOLUTIONS[name]
+        print(f"Benchmarking synthetic {name} frames...")
+        report["results"][f"synthetic_{name}"] = bench_frame(synthetic_frame(width, height), nets,
+                                                             args.runs, face_counts)
+    if args.images:
+        for path in sorted(Path(args.images).iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            frame = cv2.imread(str(path))
+            if frame is None:
+                continue
+            print(f"Benchmarking {path.name}...")
+            report["results"][f"image_{path.name}"] = bench_frame(frame, nets, args.runs, face_counts)
+
+    for case, stages in report["results"].items():
+        print(f"\n{case}")
+        for stage, stats in stages.items():
+            print(f"  {stage:<20} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_fps']} fps")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
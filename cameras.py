@@ -0,0 +1,338 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+import cv2
+from pipeline import FramePipeline
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# Playback rate of image directories, and of video files that report no rate
+IMAGE_DIRECTORY_FPS = 1.0
+DEFAULT_FILE_FPS = 25.0
+# Camera config keys that configure the source rather than DetectionPipeline
+SOURCE_OPTIONS = ('fps', 'loop')
+
+
+class ImageDirectoryCapture:
+    """cv2.VideoCapture-like reader that cycles through the images in a directory"""
+
+    def __init__(self, path, loop=True):
+        self.paths = sorted(str(p) for p in Path(path).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        self.loop = loop
+        self.index = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def get(self, prop):
+        return IMAGE_DIRECTORY_FPS if prop == cv2.CAP_PROP_FPS else 0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.index = int(value)
+        return True
+
+    def grab(self):
+        if self.index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False
+            self.index = 0
+        self.index += 1
+        return True
+
+    def retrieve(self):
+        frame = cv2.imread(self.paths[self.index - 1])
+        return frame is not None, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.paths = []
+
+
+class PacedCapture:
+    """
+    Plays a video file or image directory in real time, like a live camera.
+    read() waits until the next frame is due; frames that fell due while
+    inference was busy are skipped without being decoded and counted as
+    frames_dropped. fps defaults to the source's CAP_PROP_FPS. With loop,
+    playback restarts at the end instead of ending the camera's stream.
+    """
+
+    def __init__(self, capture, fps=None, loop=True, metrics=None):
+        self.capture = capture
+        self.fps = float(fps or capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FILE_FPS)
+        self.loop = loop
+        self.metrics = metrics
+        self.start = None
+        # Frames grabbed since start
+        self.position = 0
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def _grab(self):
+        if self.capture.grab():
+            return True
+        if not self.loop:
+            return False
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self.capture.grab()
+
+    def read(self):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        due = self.start + self.position / self.fps
+        if due > now:
+            time.sleep(due - now)
+        else:
+            for _ in range(int((now - self.start) * self.fps) - self.position):
+                if not self._grab():
+                    return False, None
+                self.position += 1
+                if self.metrics is not None:
+                    self.metrics.inc("frames_dropped")
+        if not self._grab():
+            return False, None
+        self.position += 1
+        return self.capture.retrieve()
+
+    def release(self):
+        self.capture.release()
+
+
+class LatestFrameCapture:
+    """
+    Wraps a live capture so inference always works on the freshest frame.
+    A background thread keeps draining the device with grab(); only a frame
+    grabbed while a reader is waiting is decoded with retrieve(). The rest
+    are dropped without being decoded and counted as frames_dropped, so
+    frames never queue up in the driver when inference is slower than the
+    camera. Frames are decoded into `buffers` alternating arrays, so a frame
+    returned by read() stays intact until buffers - 1 further reads.
+    """
+
+    def __init__(self, capture, metrics=None, buffers=2):
+        self.capture = capture
+        self.metrics = metrics
+        self.buffers = [None] * max(1, int(buffers))
+        self.next_buffer = 0
+        self.condition = threading.Condition()
+        self.frame = None
+        self.waiting = False
+        self.running = capture.isOpened()
+        self.thread = threading.Thread(target=self._run, name="latest-frame-capture", daemon=True)
+        if self.running:
+            self.thread.start()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def _run(self):
+        while self.running:
+            if not self.capture.grab():
+                break
+            with self.condition:
+                wanted = self.waiting and self.frame is None
+            if not wanted:
+                if self.metrics is not None:
+                    self.metrics.inc("frames_dropped")
+                continue
+            success, frame = self.capture.retrieve(self.buffers[self.next_buffer])
+            if success:
+                self.buffers[self.next_buffer] = frame
+                self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+            with self.condition:
+                if success:
+                    self.frame = frame
+                self.condition.notify_all()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def read(self):
+        """Block until the next frame is grabbed and return (success, frame)"""
+        with self.condition:
+            self.waiting = True
+            while self.frame is None and self.running:
+                self.condition.wait(1.0)
+            frame, self.frame = self.frame, None
+            self.waiting = False
+        return frame is not None, frame
+
+    def release(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+        self.capture.release()
+
+
+def open_source(source, metrics=None, fps=None, loop=True):
+    """
+    Open a device index, image directory, video file or stream URL. Live
+    sources (devices and stream URLs) are wrapped in a LatestFrameCapture;
+    files and directories are played in real time at fps by a PacedCapture,
+    restarting at the end if loop is set.
+    """
+    if isinstance(source, int) or str(source).isdigit():
+        return LatestFrameCapture(cv2.VideoCapture(int(source)), metrics)
+    if '://' in str(source):
+        return LatestFrameCapture(cv2.VideoCapture(source), metrics)
+    if os.path.isdir(source):
+        return PacedCapture(ImageDirectoryCapture(source, loop=False), fps, loop, metrics)
+    return PacedCapture(cv2.VideoCapture(source), fps, loop, metrics)
+
+
+def load_camera_config():
+    """
+    Read the camera list from the CAMERAS_FILE JSON file or the CAMERAS variable.
+    CAMERAS_FILE maps camera ids to a source or to {"source": ..., "fps": ..., "loop": ...,
+    <processor options>}; fps and loop apply to video files and image directories.
+    CAMERAS is a comma separated list of id=source pairs, e.g. "front=0,lobby=/data/lobby.mp4".
+    Returns a dict of camera id to config dict.
+    """
+    cameras = {}
+    config_file = os.environ.get('CAMERAS_FILE')
+    if config_file:
+        with open(config_file) as f:
+            for cam_id, config in json.load(f).items():
+                cameras[str(cam_id)] = config if isinstance(config, dict) else {"source": config}
+    for entry in os.environ.get('CAMERAS', '').split(','):
+        if '=' in entry:
+            cam_id, source = entry.split('=', 1)
+            cameras[cam_id.strip()] = {"source": source.strip()}
+    return cameras
+
+
+def camera_worker(cam_id, source, options, conn, source_options=None):
+    """Capture and inference loop of one camera, run in its own process"""
+    # Imported here so the parent process never loads the nets for worker cameras
+    from models import load_models, current_dnn_config
+    from safenest import DetectionPipeline
+    from metrics import MetricsBuffer, Timer
+
+    # Metrics are buffered here and replayed by the parent with each frame
+    metrics = MetricsBuffer()
+    capture = open_source(source, metrics, **(source_options or {}))
+    if not capture.isOpened():
+        print(f"Error: Could not open source {source!r} for camera {cam_id}")
+        capture.release()
+        conn.close()
+        return
+    try:
+        faceNet, genderNet = load_models()
+        metrics.set_dnn_config(current_dnn_config())
+        processor = DetectionPipeline(faceNet, genderNet, metrics=metrics, **options)
+        while True:
+            with Timer(metrics, "capture"):
+                success, frame = capture.read()
+            if not success:
+                print(f"Failed to grab frame from camera {cam_id}")
+                break
+            frame_bytes, detection_info = processor(frame)
+            if frame_bytes is None:
+                metrics.inc("frames_dropped")
+                continue
+            conn.send((frame_bytes, detection_info, metrics.drain()))
+    except (BrokenPipeError, EOFError, KeyboardInterrupt):
+        pass
+    except Exception as e:
+        print(f"Error in camera worker {cam_id}: {e}")
+    finally:
+        capture.release()
+        conn.close()
+
+
+class WorkerPipeline(FramePipeline):
+    """FramePipeline fed by a camera worker process instead of an in-process capture"""
+
+    def __init__(self, cam_id, source, options=None, source_options=None):
+        super().__init__(None, None, name=cam_id)
+        self.cam_id = cam_id
+        self.source = source
+        self.options = options or {}
+        self.source_options = source_options or {}
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        if self.running:
+            return
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe(duplex=False)
+        self.process = context.Process(target=camera_worker, name=f"camera-{self.cam_id}",
+                                       args=(self.cam_id, self.source, self.options, child_conn, self.source_options),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        super().start()
+
+    def _run(self):
+        while self.running:
+            try:
+                if not self.conn.poll(0.5):
+                    if not self.process.is_alive():
+                        break
+                    continue
+                frame_bytes, detection_info, observations = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            self.metrics.apply(observations)
+            self.publish(frame_bytes, detection_info)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def stop(self):
+        super().stop()
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=2.0)
+        if self.conn is not None:
+            self.conn.close()
+
+
+class CameraRegistry:
+    """Owns one worker pipeline per configured camera; workers start on first use"""
+
+    def __init__(self, cameras, options=None, recorder_factory=None):
+        self.lock = threading.Lock()
+        self.pipelines = {}
+        for cam_id, config in cameras.items():
+            camera_options = dict(options or {})
+            camera_options.update({k: v for k, v in config.items() if k != 'source' and k not in SOURCE_OPTIONS})
+            source_options = {k: v for k, v in config.items() if k in SOURCE_OPTIONS}
+            self.pipelines[cam_id] = WorkerPipeline(cam_id, config['source'], camera_options, source_options)
+            if recorder_factory is not None:
+                self.pipelines[cam_id].recorder = recorder_factory(cam_id)
+
+    def __bool__(self):
+        return bool(self.pipelines)
+
+    def ids(self):
+        return list(self.pipelines)
+
+    def get(self, cam_id):
+        """Return the running pipeline for cam_id; raises KeyError for unknown cameras"""
+        with self.lock:
+            pipeline = self.pipelines[cam_id]
+            if not pipeline.running:
+                pipeline.start()
+            return pipeline
+
+    def peek(self, cam_id):
+        """Return the pipeline for cam_id without starting it"""
+        return self.pipelines[cam_id]
+
+    def stop_all(self):
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
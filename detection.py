@@ -0,0 +1,280 @@
+import cv2
+import numpy as np
+from models import MODEL_MEAN_VALUES, GENDER_LIST
+
+# Input size and mean values of the SSD face detector
+FACE_INPUT_SIZE = (300, 300)
+FACE_MEAN_VALUES = [104, 117, 123]
+
+# Maximum number of face crops sent through the gender net in one forward pass
+MAX_GENDER_BATCH = 16
+
+# Input size of the gender net
+GENDER_INPUT_SIZE = (227, 227)
+
+# Decision thresholds shared by every entry point and the alert rules
+CONF_THRESHOLD = 0.7
+# A lone woman with at least this many men around her is "surrounded"
+SURROUNDED_MIN_MALES = 3
+# Coverage ratios from which the camera counts as partly / fully covered
+COVERAGE_WARNING_RATIO = 0.4
+COVERAGE_FULL_RATIO = 0.99
+
+_FACE_MEAN = np.array(FACE_MEAN_VALUES, dtype=np.float32).reshape(3, 1, 1)
+_GENDER_MEAN = np.array(MODEL_MEAN_VALUES, dtype=np.float32).reshape(3, 1, 1)
+
+
+class FrameBuffers:
+    """
+    Scratch arrays the streaming pipeline reuses from frame to frame, so the
+    hot loop allocates no new blobs or images. An array is only reallocated
+    when its shape changes, e.g. for a new camera resolution. Not thread
+    safe: use one instance per processing thread.
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype):
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = self.arrays[name] = np.empty(shape, dtype)
+        return array
+
+
+def fill_blob(dst, image, size, mean, swap_rb, buffers, name):
+    """
+    In-place equivalent of blobFromImage for one image: resize into a reused
+    buffer, then write the mean-subtracted planes into dst (3 x H x W float32).
+    """
+    resized = buffers.get(name, (size[1], size[0], 3), np.uint8)
+    cv2.resize(image, size, dst=resized)
+    planes = resized.transpose(2, 0, 1)
+    np.subtract(planes[::-1] if swap_rb else planes, mean, out=dst)
+
+
+def postprocess_detections(detections, frameWidth, frameHeight, conf_threshold=0.7):
+    """
+    Turn raw SSD output of shape (1, 1, N, 7) into pixel boxes.
+    Rows are filtered with one threshold mask, scaled to the frame size and
+    clipped to its bounds. Returns (boxes, confidences) where boxes is an
+    int32 array of x1, y1, x2, y2 rows.
+    """
+    detections = detections.reshape(-1, 7)
+    detections = detections[detections[:, 2] > conf_threshold]
+    scale = np.array([frameWidth, frameHeight, frameWidth, frameHeight], dtype=np.float32)
+    boxes = detections[:, 3:7] * scale
+    np.clip(boxes[:, 0::2], 0, frameWidth - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, frameHeight - 1, out=boxes[:, 1::2])
+    boxes = boxes.astype(np.int32)
+    keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes[keep], detections[keep, 2]
+
+
+def detect_faces(net, frame, conf_threshold=0.7, buffers=None):
+    """
+    Run the face detector on a frame and return (boxes, confidences) without
+    drawing. With buffers, the input blob is written into a reused array.
+    """
+    frameHeight, frameWidth = frame.shape[:2]
+    if buffers is not None:
+        blob = buffers.get("face_blob", (1, 3, FACE_INPUT_SIZE[1], FACE_INPUT_SIZE[0]), np.float32)
+        fill_blob(blob[0], frame, FACE_INPUT_SIZE, _FACE_MEAN, True, buffers, "face_resized")
+    else:
+        blob = cv2.dnn.blobFromImage(frame, 1.0, FACE_INPUT_SIZE, FACE_MEAN_VALUES, True, False)
+    net.setInput(blob)
+    detections = net.forward()
+    return postprocess_detections(detections, frameWidth, frameHeight, conf_threshold)
+
+
+def tile_grid(frameWidth, frameHeight, tile_size, overlap=0.25):
+    """
+    Return (x, y, w, h) tiles of at most tile_size x tile_size that cover the
+    frame, neighbouring tiles overlapping by the given fraction so that a
+    face on a tile border is whole in at least one tile.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        # Fewest evenly spaced tiles whose overlap is at least the requested one
+        step = max(1, int(tile_size * (1.0 - overlap)))
+        count = -(-(length - tile_size) // step) + 1
+        return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+    return [(x, y, min(tile_size, frameWidth), min(tile_size, frameHeight))
+            for y in starts(frameHeight) for x in starts(frameWidth)]
+
+
+class TiledFaceDetector:
+    """
+    Multi-scale face detection for high resolution frames. The frame is cut
+    into overlapping tiles that are each fed to the 300x300 detector at close
+    to their native scale, plus the whole frame for faces larger than a tile.
+    All inputs go through one batched forward pass; boxes are mapped back to
+    frame coordinates and merged with non-maximum suppression. Nets that
+    cannot run batches fall back to one forward pass per tile.
+    """
+
+    def __init__(self, tile_size=600, overlap=0.25, nms_threshold=0.4):
+        self.tile_size = int(tile_size)
+        self.overlap = overlap
+        self.nms_threshold = nms_threshold
+        self.batched = True
+
+    def _forward(self, net, crops):
+        """Return raw (1, 1, N, 7) detections of each crop"""
+        if self.batched and len(crops) > 1:
+            blob = cv2.dnn.blobFromImages(crops, 1.0, FACE_INPUT_SIZE, FACE_MEAN_VALUES, True, False)
+            try:
+                net.setInput(blob)
+                detections = net.forward().reshape(-1, 7)
+                return [detections[detections[:, 0] == i] for i in range(len(crops))]
+            except cv2.error as e:
+                print(f"Batched face detection unsupported, detecting tile by tile: {e}")
+                self.batched = False
+        results = []
+        for crop in crops:
+            net.setInput(cv2.dnn.blobFromImage(crop, 1.0, FACE_INPUT_SIZE, FACE_MEAN_VALUES, True, False))
+            results.append(net.forward())
+        return results
+
+    def __call__(self, net, frame, conf_threshold=0.7):
+        """Return (boxes, confidences) like detect_faces"""
+        frameHeight, frameWidth = frame.shape[:2]
+        tiles = tile_grid(frameWidth, frameHeight, self.tile_size, self.overlap)
+        if len(tiles) == 1:
+            return detect_faces(net, frame, conf_threshold)
+        regions = [(0, 0, frameWidth, frameHeight)] + tiles
+        crops = [frame[y:y + h, x:x + w] for x, y, w, h in regions]
+        all_boxes, all_confidences = [], []
+        for (x, y, w, h), detections in zip(regions, self._forward(net, crops)):
+            boxes, confidences = postprocess_detections(detections, w, h, conf_threshold)
+            all_boxes.append(boxes + np.array([x, y, x, y], dtype=np.int32))
+            all_confidences.append(confidences)
+        boxes = np.concatenate(all_boxes)
+        confidences = np.concatenate(all_confidences)
+        if len(boxes) == 0:
+            return boxes, confidences
+        xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]]).tolist()
+        keep = np.asarray(cv2.dnn.NMSBoxes(xywh, confidences.tolist(), conf_threshold,
+                                           self.nms_threshold), dtype=np.int64).reshape(-1)
+        return boxes[keep], confidences[keep]
+
+
+def draw_face_boxes(frame, bboxes, copy=True):
+    """Draw face rectangles, on a copy of the frame unless copy is False"""
+    frameOpencvDnn = frame.copy() if copy else frame
+    thickness = int(round(frame.shape[0] / 150))
+    for x1, y1, x2, y2 in np.asarray(bboxes, dtype=np.int32).reshape(-1, 4).tolist():
+        cv2.rectangle(frameOpencvDnn, (x1, y1), (x2, y2), (0, 255, 0), thickness, 8)
+    return frameOpencvDnn
+
+
+def crop_face(frame, bbox, padding=20):
+    """Return the padded face region for a bounding box, or None if it is empty"""
+    face = frame[max(0, bbox[1] - padding):min(bbox[3] + padding, frame.shape[0] - 1),
+                 max(0, bbox[0] - padding):min(bbox[2] + padding, frame.shape[1] - 1)]
+    if face.size == 0:
+        return None
+    return face
+
+
+def classify_genders(net, frame, bboxes, padding=20, max_batch_size=MAX_GENDER_BATCH, buffers=None):
+    """
+    Classify the gender of every face in the frame.
+    Face crops are stacked into N x 3 x 227 x 227 blobs with blobFromImages so
+    the gender net runs once per batch instead of once per face. With
+    buffers, the batch is written into a reused blob instead. Returns one
+    GENDER_LIST label per bounding box (None where the crop was empty).
+    """
+    genders = [None] * len(bboxes)
+    indices = []
+    faces = []
+    for i, bbox in enumerate(bboxes):
+        face = crop_face(frame, bbox, padding)
+        if face is not None:
+            indices.append(i)
+            faces.append(face)
+
+    max_batch_size = max(1, int(max_batch_size))
+    for start in range(0, len(faces), max_batch_size):
+        batch = faces[start:start + max_batch_size]
+        if buffers is not None:
+            blob = buffers.get("gender_blob", (max_batch_size, 3, GENDER_INPUT_SIZE[1], GENDER_INPUT_SIZE[0]),
+                               np.float32)[:len(batch)]
+            for dst, face in zip(blob, batch):
+                fill_blob(dst, face, GENDER_INPUT_SIZE, _GENDER_MEAN, False, buffers, "gender_resized")
+        else:
+            blob = cv2.dnn.blobFromImages(batch, 1.0, GENDER_INPUT_SIZE, MODEL_MEAN_VALUES, swapRB=False)
+        net.setInput(blob)
+        genderPreds = net.forward()
+        for i, pred in zip(indices[start:start + max_batch_size], np.argmax(genderPreds, axis=1)):
+            genders[i] = GENDER_LIST[pred]
+    return genders
+
+
+def count_genders(genders):
+    """Return (numMales, numFemales) for a list of gender labels"""
+    numMales = sum(1 for gender in genders if gender == 'Male')
+    numFemales = sum(1 for gender in genders if gender == 'Female')
+    return numMales, numFemales
+
+
+def cell_variances(frame, grid_rows=3, grid_cols=3, max_width=None, buffers=None):
+    """
+    Return a grid_rows x grid_cols array with the variance of the Laplacian of
+    each grid cell. The frame is converted to grayscale and filtered once, and
+    per-cell sums come from a single pair of integral images, so the cost does
+    not grow with the number of cells. If max_width is set, wider frames are
+    downscaled to that width first. With buffers, the grayscale, Laplacian
+    and integral images are written into reused arrays.
+    """
+    buffers = buffers if buffers is not None else FrameBuffers()
+    if frame.ndim == 3:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                            dst=buffers.get("gray", frame.shape[:2], np.uint8))
+    else:
+        gray = frame
+    height, width = gray.shape[:2]
+    if max_width and width > max_width:
+        height = max(1, int(round(height * max_width / width)))
+        width = int(max_width)
+        gray = cv2.resize(gray, (width, height), dst=buffers.get("gray_small", (height, width), np.uint8),
+                          interpolation=cv2.INTER_AREA)
+    # The 3x3 Laplacian of an 8-bit image always fits in int16
+    laplacian = cv2.Laplacian(gray, cv2.CV_16S, dst=buffers.get("laplacian", (height, width), np.int16))
+    sums, sqsums = cv2.integral2(laplacian, buffers.get("sums", (height + 1, width + 1), np.float64),
+                                 buffers.get("sqsums", (height + 1, width + 1), np.float64),
+                                 cv2.CV_64F, cv2.CV_64F)
+
+    # Cell edges match the original grid: the last row/column absorbs the remainder
+    ys = np.arange(grid_rows + 1) * (height // grid_rows)
+    ys[-1] = height
+    xs = np.arange(grid_cols + 1) * (width // grid_cols)
+    xs[-1] = width
+    y1, y2 = ys[:-1, None], ys[1:, None]
+    x1, x2 = xs[None, :-1], xs[None, 1:]
+
+    counts = (y2 - y1) * (x2 - x1)
+    cell_sums = sums[y2, x2] - sums[y1, x2] - sums[y2, x1] + sums[y1, x1]
+    cell_sqsums = sqsums[y2, x2] - sqsums[y1, x2] - sqsums[y2, x1] + sqsums[y1, x1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = cell_sums / counts
+        return cell_sqsums / counts - means * means
+
+
+def coverage_map(frame, grid_rows=3, grid_cols=3, variance_threshold=100.0, max_width=None, buffers=None):
+    """
+    Return (coverage_ratio, covered) where covered is a boolean grid marking the
+    cells whose Laplacian variance is below variance_threshold.
+    """
+    covered = cell_variances(frame, grid_rows, grid_cols, max_width, buffers) < variance_threshold
+    return float(covered.mean()), covered
+
+
+def check_coverage(frame, grid_rows=3, grid_cols=3, variance_threshold=100.0, max_width=None):
+    """
+    Divides the frame into a grid and calculates the fraction of grid cells that are "covered"
+    (i.e. have low variance of the Laplacian). Returns the overall coverage ratio.
+    """
+    coverage_ratio, _ = coverage_map(frame, grid_rows, grid_cols, variance_threshold, max_width)
+    return coverage_ratio
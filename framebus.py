@@ -0,0 +1,253 @@
+"""
+Shared-memory frame bus: one capture and inference process publishes the
+latest raw frame, annotated JPEG and detection info; any number of web
+worker processes read them without opening the camera or loading the nets.
+
+    FRAME_BUS=safenest python framebus.py        # producer
+    FRAME_BUS=safenest gunicorn -w 4 "stream_server:create_app(warm_up_models=True)"
+
+gunicorn.conf.py starts the producer automatically when FRAME_BUS is set.
+"""
+import json
+import os
+import signal
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from pipeline import FramePipeline
+
+HEADER_DTYPE = np.dtype([
+    ("sequence", np.uint64),
+    ("timestamp", np.float64),
+    ("height", np.uint32),
+    ("width", np.uint32),
+    ("channels", np.uint32),
+    ("jpeg_size", np.uint32),
+    ("info_size", np.uint32),
+    ("raw_capacity", np.uint32),
+    ("jpeg_capacity", np.uint32),
+    ("info_capacity", np.uint32),
+])
+HEADER_SIZE = 64
+
+# Capacity of each region of the segment
+MAX_RAW_BYTES = int(os.environ.get('FRAME_BUS_MAX_RAW_BYTES', 1920 * 1080 * 3))
+MAX_JPEG_BYTES = int(os.environ.get('FRAME_BUS_MAX_JPEG_BYTES', 2 * 1024 * 1024))
+MAX_INFO_BYTES = int(os.environ.get('FRAME_BUS_MAX_INFO_BYTES', 64 * 1024))
+
+
+class FrameBus:
+    """
+    One shared memory segment holding a header and the raw frame, JPEG and
+    JSON detection info regions, guarded by a seqlock: the writer makes the
+    sequence odd while it writes and even when done, and a reader only
+    accepts data it copied between two reads of the same even sequence.
+    There is a single writer; readers never block it.
+    """
+
+    def __init__(self, name, create=False, max_raw_bytes=MAX_RAW_BYTES, max_jpeg_bytes=MAX_JPEG_BYTES,
+                 max_info_bytes=MAX_INFO_BYTES):
+        self.name = name
+        self.create = create
+        if create:
+            size = HEADER_SIZE + max_raw_bytes + max_jpeg_bytes + max_info_bytes
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Left behind by a producer that did not shut down cleanly
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+            header = np.frombuffer(self.shm.buf, dtype=HEADER_DTYPE, count=1)
+            header["raw_capacity"] = max_raw_bytes
+            header["jpeg_capacity"] = max_jpeg_bytes
+            header["info_capacity"] = max_info_bytes
+            del header
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Readers must not unlink the producer's segment when they exit
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.header = np.frombuffer(self.shm.buf, dtype=HEADER_DTYPE, count=1)
+        # Region sizes always come from the producer's header
+        max_raw_bytes = int(self.header[0]["raw_capacity"])
+        max_jpeg_bytes = int(self.header[0]["jpeg_capacity"])
+        max_info_bytes = int(self.header[0]["info_capacity"])
+        raw_end = HEADER_SIZE + max_raw_bytes
+        jpeg_end = raw_end + max_jpeg_bytes
+        buf = np.frombuffer(self.shm.buf, dtype=np.uint8)
+        self.raw = buf[HEADER_SIZE:raw_end]
+        self.jpeg = buf[raw_end:jpeg_end]
+        self.info = buf[jpeg_end:jpeg_end + max_info_bytes]
+        if not create:
+            for array in (self.header, self.raw, self.jpeg, self.info):
+                array.flags.writeable = False
+
+    def write(self, raw, jpeg, detection_info):
+        """Publish one frame; raw may be None and is skipped if it does not fit"""
+        info = json.dumps(detection_info).encode()
+        if len(jpeg) > len(self.jpeg) or len(info) > len(self.info):
+            raise ValueError("Frame does not fit in the frame bus; raise FRAME_BUS_MAX_JPEG_BYTES")
+        header = self.header[0]
+        sequence = int(header["sequence"])
+        header["sequence"] = sequence + 1
+        if raw is not None and raw.nbytes <= len(self.raw):
+            self.raw[:raw.nbytes] = raw.reshape(-1)
+            header["height"], header["width"] = raw.shape[:2]
+            header["channels"] = raw.shape[2] if raw.ndim == 3 else 1
+        else:
+            header["height"] = header["width"] = header["channels"] = 0
+        self.jpeg[:len(jpeg)] = np.frombuffer(jpeg, dtype=np.uint8)
+        self.info[:len(info)] = np.frombuffer(info, dtype=np.uint8)
+        header["jpeg_size"] = len(jpeg)
+        header["info_size"] = len(info)
+        header["timestamp"] = time.time()
+        header["sequence"] = sequence + 2
+
+    def sequence(self):
+        return int(self.header[0]["sequence"]) // 2
+
+    def read(self, last_sequence=0, raw=False, retries=100):
+        """
+        Return (sequence, jpeg_bytes, detection_info[, raw_frame]) if a frame
+        newer than last_sequence was published, else None.
+        """
+        header = self.header[0]
+        for _ in range(retries):
+            begin = int(header["sequence"])
+            if begin & 1:
+                time.sleep(0)
+                continue
+            if begin // 2 == last_sequence or begin == 0:
+                return None
+            jpeg = self.jpeg[:int(header["jpeg_size"])].tobytes()
+            info = self.info[:int(header["info_size"])].tobytes()
+            frame = None
+            if raw and header["height"]:
+                shape = (int(header["height"]), int(header["width"]), int(header["channels"]))
+                frame = self.raw[:shape[0] * shape[1] * shape[2]].reshape(shape).copy()
+            if int(header["sequence"]) == begin:
+                result = (begin // 2, jpeg, json.loads(info))
+                return result + (frame,) if raw else result
+        return None
+
+    def close(self):
+        # Drop the numpy views first; the segment cannot close while they exist
+        self.header = self.raw = self.jpeg = self.info = None
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+
+class BusPipeline(FramePipeline):
+    """
+    FramePipeline of a web worker fed from the frame bus. Each new frame is
+    copied out of shared memory once and shared by every viewer of this
+    worker; alerts and recording happen in the producer, so detection info
+    is passed through unchanged.
+    """
+
+    def __init__(self, bus_name, name='default', poll_interval=0.005, stale_after=2.0):
+        super().__init__(None, None, name=name)
+        self.alerts = None
+        self.bus_name = bus_name
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.bus = None
+        self.bus_sequence = 0
+
+    def _run(self):
+        last_frame = time.monotonic()
+        while self.running:
+            if self.bus is None:
+                try:
+                    self.bus = FrameBus(self.bus_name)
+                    self.bus_sequence = 0
+                    last_frame = time.monotonic()
+                except FileNotFoundError:
+                    time.sleep(0.5)
+                    continue
+            result = self.bus.read(self.bus_sequence)
+            if result is None:
+                if time.monotonic() - last_frame > self.stale_after:
+                    # The producer may have restarted with a new segment
+                    self.bus.close()
+                    self.bus = None
+                time.sleep(self.poll_interval)
+                continue
+            self.bus_sequence, frame_bytes, detection_info = result
+            last_frame = time.monotonic()
+            self.publish(frame_bytes, detection_info)
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+class BusWriterPipeline(FramePipeline):
+    """Producer side: a regular FramePipeline that also writes every result to the bus"""
+
+    def __init__(self, capture, processor, bus, name='default'):
+        super().__init__(capture, self._process, name=name)
+        self.processor = processor
+        self.bus = bus
+        self.raw = None
+
+    def _process(self, frame):
+        # Keep the unannotated frame; the processor draws in place
+        if self.raw is None or self.raw.shape != frame.shape:
+            self.raw = np.empty_like(frame)
+        np.copyto(self.raw, frame)
+        return self.processor(frame)
+
+    def publish(self, frame, detection_info):
+        super().publish(frame, detection_info)
+        with self.condition:
+            encoded, detection_info = self.frame, self.detection_info
+        frame_bytes = encoded.get()
+        if frame_bytes is not None:
+            self.bus.write(self.raw, frame_bytes, detection_info)
+
+
+def main():
+    import stream_server
+    from cameras import open_source
+    from models import load_models, current_dnn_config
+    from safenest import DetectionPipeline
+    from metrics import REGISTRY
+
+    bus_name = os.environ.get('FRAME_BUS', 'safenest')
+    source = os.environ.get('FRAME_BUS_SOURCE', '0')
+    cam_id = stream_server.DEFAULT_CAMERA_ID
+    metrics = REGISTRY.camera(cam_id)
+    capture = open_source(source, metrics)
+    if not capture.isOpened():
+        print(f"Error: Could not open source {source!r}")
+        sys.exit(1)
+    faceNet, genderNet = load_models()
+    metrics.set_dnn_config(current_dnn_config())
+    processor = DetectionPipeline(faceNet, genderNet, padding=stream_server.padding, metrics=metrics,
+                                  **stream_server.PROCESSOR_OPTIONS)
+    bus = FrameBus(bus_name, create=True)
+    pipeline = BusWriterPipeline(capture, processor, bus, name=cam_id)
+    pipeline.recorder = stream_server.make_recorder(cam_id)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Publishing {source!r} on frame bus {bus_name!r}")
+    try:
+        pipeline.start()
+        while pipeline.running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        capture.release()
+        bus.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+# With FRAME_BUS set, the master starts the single capture and inference
+# process (framebus.py) before forking; every worker reads from its bus
+producer = None
+
+
+def on_starting(server):
+    global producer
+    if os.environ.get('FRAME_BUS'):
+        producer = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), 'framebus.py')])
+
+
+def on_exit(server):
+    if producer is not None:
+        producer.terminate()
+        producer.wait(timeout=5)
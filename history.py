@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+import numpy as np
+
+# Status strings of DetectionPipeline.analyze, least to most severe; rollups
+# keep the most severe status seen in each bucket
+STATUSES = (
+    "No person detected",
+    "Woman is alone",
+    "Multiple persons detected",
+    "Warning: Woman is surrounded by men",
+)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Columns kept per published frame
+FRAME_COLUMNS = (
+    ("time", np.float64),
+    ("num_persons", np.int16),
+    ("num_males", np.int16),
+    ("num_females", np.int16),
+    ("coverage_ratio", np.float32),
+    ("status", np.int8),
+)
+
+# Columns kept per rollup bucket; bucket is the bucket number
+# (timestamp // resolution) a slot holds, or -1 if the slot is empty
+ROLLUP_COLUMNS = (
+    ("bucket", np.int64),
+    ("frames", np.uint32),
+    ("sum_persons", np.float64),
+    ("sum_males", np.float64),
+    ("sum_females", np.float64),
+    ("sum_coverage", np.float64),
+    ("max_persons", np.int16),
+    ("max_males", np.int16),
+    ("max_females", np.int16),
+    ("max_coverage", np.float32),
+    ("max_status", np.int8),
+)
+
+# (resolution in seconds, number of buckets kept): 1 s for an hour, 1 min
+# for a day and 1 h for 30 days
+ROLLUP_LEVELS = ((1, 3600), (60, 1440), (3600, 720))
+# Raw frames kept per camera, about 5 minutes at 30 fps
+HISTORY_FRAMES = int(os.environ.get('HISTORY_FRAMES', 9000))
+# Largest number of points a single query may return
+MAX_HISTORY_POINTS = int(os.environ.get('MAX_HISTORY_POINTS', 10000))
+
+
+class Rollup:
+    """
+    Fixed-size ring of buckets; bucket n lives in slot n % capacity. The
+    open bucket is accumulated in plain Python and stored in the columns
+    when the next bucket starts or a query reads it.
+    """
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in ROLLUP_COLUMNS}
+        self.columns["bucket"][:] = -1
+        self.current = None
+
+    def add(self, now, num_persons, num_males, num_females, coverage_ratio, status):
+        bucket = int(now // self.resolution)
+        current = self.current
+        if current is None or current[0] != bucket:
+            self.flush()
+            self.current = [bucket, 1, num_persons, num_males, num_females, coverage_ratio,
+                            num_persons, num_males, num_females, coverage_ratio, status]
+            return
+        current[1] += 1
+        current[2] += num_persons
+        current[3] += num_males
+        current[4] += num_females
+        current[5] += coverage_ratio
+        current[6] = max(current[6], num_persons)
+        current[7] = max(current[7], num_males)
+        current[8] = max(current[8], num_females)
+        current[9] = max(current[9], coverage_ratio)
+        current[10] = max(current[10], status)
+
+    def flush(self):
+        """Store the open bucket in its slot, replacing whatever aged out there"""
+        if self.current is not None:
+            slot = self.current[0] % self.capacity
+            for (name, _), value in zip(ROLLUP_COLUMNS, self.current):
+                self.columns[name][slot] = value
+
+    def range(self, start, end):
+        """Columns of the non-empty buckets between start and end, oldest first"""
+        self.flush()
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        # Older buckets have been overwritten
+        first = max(first, last - self.capacity + 1)
+        buckets = np.arange(first, max(first, last + 1))
+        slots = buckets % self.capacity
+        slots = slots[self.columns["bucket"][slots] == buckets]
+        return {name: column[slots] for name, column in self.columns.items()}
+
+
+class DetectionHistory:
+    """
+    Columnar time series of one camera's detection results. The last
+    max_frames raw frames are kept in a ring buffer, and 1 s, 1 min and 1 h
+    rollups (count, sums and maxima per bucket) are updated incrementally on
+    every frame, so memory is fixed and a query only touches the buckets it
+    returns.
+    """
+
+    def __init__(self, max_frames=HISTORY_FRAMES, levels=ROLLUP_LEVELS, max_points=MAX_HISTORY_POINTS):
+        self.capacity = max(1, int(max_frames))
+        self.frames = {name: np.zeros(self.capacity, dtype) for name, dtype in FRAME_COLUMNS}
+        self.size = 0
+        self.index = 0
+        self.rollups = [Rollup(resolution, capacity) for resolution, capacity in levels]
+        self.max_points = max_points
+        self.lock = threading.Lock()
+
+    def add(self, detection_info, now=None):
+        """Record one frame's detection info"""
+        now = time.time() if now is None else now
+        values = (
+            now,
+            int(detection_info.get("num_persons", 0)),
+            int(detection_info.get("num_males", 0)),
+            int(detection_info.get("num_females", 0)),
+            float(detection_info.get("coverage_ratio", 0)),
+            STATUS_CODES.get(detection_info.get("status"), 0),
+        )
+        with self.lock:
+            for column, value in zip(self.frames.values(), values):
+                column[self.index] = value
+            self.index = (self.index + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            for rollup in self.rollups:
+                rollup.add(*values)
+
+    def _raw_range(self, start, end):
+        # The ring is two time-ordered runs of slots: [index, size) then [0, index)
+        runs = ((0, self.size),) if self.size < self.capacity else ((self.index, self.capacity), (0, self.index))
+        times = self.frames["time"]
+        slots = []
+        for first, last in runs:
+            run = times[first:last]
+            slots.append(np.arange(first + np.searchsorted(run, start, 'left'),
+                                   first + np.searchsorted(run, end, 'right')))
+        slots = np.concatenate(slots)
+        return {name: column[slots] for name, column in self.frames.items()}
+
+    def query(self, start=None, end=None, step=None):
+        """
+        Return the history between start and end (epoch seconds, default the
+        last hour) as columns. step < 1 returns raw frames; otherwise the
+        coarsest rollup no finer than step is merged into step-second
+        buckets. Without a step, the finest rollup that still covers start
+        and stays within max_points is used. Raises ValueError for invalid
+        ranges or results larger than max_points.
+        """
+        end = time.time() if end is None else float(end)
+        start = end - 3600 if start is None else float(start)
+        if end < start:
+            raise ValueError("'from' must not be after 'to'")
+        if step is None:
+            step = self.rollups[-1].resolution
+            for rollup in self.rollups:
+                retention = rollup.resolution * rollup.capacity
+                if end - start <= retention and (end - start) / rollup.resolution <= self.max_points:
+                    step = rollup.resolution
+                    break
+        step = float(step)
+        if step < 0:
+            raise ValueError("'step' must not be negative")
+
+        if step < 1:
+            with self.lock:
+                rows = self._raw_range(start, end)
+            if len(rows["time"]) > self.max_points:
+                raise ValueError(f"More than {self.max_points} frames in range; use a larger step")
+            result = {"from": start, "to": end, "step": 0}
+            result.update((name, column.tolist()) for name, column in rows.items())
+            result["statuses"] = list(STATUSES)
+            return result
+
+        if (end - start) / step > self.max_points:
+            raise ValueError(f"More than {self.max_points} points in range; use a larger step")
+        rollup = self.rollups[0]
+        for candidate in self.rollups:
+            if candidate.resolution <= step:
+                rollup = candidate
+        with self.lock:
+            rows = rollup.range(start, end)
+
+        # Merge rollup buckets into step-sized buckets; rows are ordered, so
+        # each output bucket is one contiguous run
+        groups = (rows["bucket"] * rollup.resolution // step).astype(np.int64)
+        starts = np.flatnonzero(np.diff(groups, prepend=groups[:1] - 1))
+
+        def merge(ufunc, column):
+            return ufunc.reduceat(rows[column], starts) if len(starts) else rows[column][:0]
+
+        frames = merge(np.add, "frames")
+        result = {"from": start, "to": end, "step": step,
+                  "time": (groups[starts] * step).tolist(), "frames": frames.tolist()}
+        for name in ("persons", "males", "females", "coverage"):
+            result["avg_" + name] = (merge(np.add, "sum_" + name) / np.maximum(frames, 1)).tolist()
+            result["max_" + name] = merge(np.maximum, "max_" + name).tolist()
+        result["max_status"] = merge(np.maximum, "max_status").tolist()
+        result["statuses"] = list(STATUSES)
+        return result
@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models import load_models, current_dnn_config
+from detection import detect_faces, classify_genders, MAX_GENDER_BATCH
+
+
+class InferencePool:
+    """
+    Thread pool whose workers each own their own faceNet/genderNet, since a
+    cv2.dnn.Net must not be used from two threads at once. OpenCV releases
+    the GIL during forward(), so the workers run inference in parallel.
+    Results are always returned in submission order.
+    """
+
+    def __init__(self, workers, config=None):
+        self.workers = max(1, int(workers))
+        # Reuse the configuration already chosen in this process so "auto"
+        # does not benchmark again in every worker thread
+        self.config = config or current_dnn_config()
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference',
+                                           initializer=self._init_worker)
+
+    def _init_worker(self):
+        self.local.nets = load_models(self.config)
+
+    def _call(self, fn, *args):
+        faceNet, genderNet = self.local.nets
+        return fn(faceNet, genderNet, *args)
+
+    def submit(self, fn, *args):
+        """Run fn(faceNet, genderNet, *args) on a worker; returns a Future"""
+        return self.executor.submit(self._call, fn, *args)
+
+    def map(self, fn, items):
+        """Run fn(faceNet, genderNet, item) for every item and return the results in order"""
+        futures = [self.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def detect_faces(self, frame, conf_threshold=0.7):
+        return self.submit(lambda faceNet, genderNet: detect_faces(faceNet, frame, conf_threshold)).result()
+
+    def gender_batch_size(self, num_faces, max_batch_size=MAX_GENDER_BATCH):
+        """Batch size that spreads num_faces over all workers"""
+        return max(1, min(int(max_batch_size), -(-num_faces // self.workers)))
+
+    def classify_genders(self, frame, bboxes, padding=20, max_batch_size=MAX_GENDER_BATCH):
+        """Same as detection.classify_genders, one batch of max_batch_size faces per worker task"""
+        max_batch_size = max(1, int(max_batch_size))
+        chunks = [bboxes[start:start + max_batch_size] for start in range(0, len(bboxes), max_batch_size)]
+        results = self.map(lambda faceNet, genderNet, chunk: classify_genders(genderNet, frame, chunk, padding,
+                                                                              max_batch_size), chunks)
+        return [gender for genders in results for gender in genders]
+
+    def warm_up(self):
+        """Start every worker so each loads its nets now rather than on its first task"""
+        self.map(lambda faceNet, genderNet, _: None, range(self.workers))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+
+# Histogram buckets (upper bounds) per metric kind
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FACE_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+BYTE_BUCKETS = (5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram. observe() takes no lock: most series
+    have a single writer (the camera's pipeline thread) and a rare lost
+    increment from concurrent tier encodes is acceptable for monitoring."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield (le, cumulative_count) pairs including +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield '+Inf', self.count
+
+
+class CameraMetrics:
+    """Hot-path counters and histograms of one camera"""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.stages = {}
+        self.counters = {"frames_processed": 0, "frames_dropped": 0, "frames_gated": 0, "gender_forward_calls": 0}
+        self.faces = Histogram(FACE_BUCKETS)
+        self.encode_bytes = Histogram(BYTE_BUCKETS)
+        self.viewers = 0
+        self.viewers_lock = threading.Lock()
+        self.dnn_config = None
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages.setdefault(stage, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+
+    def inc(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def observe_faces(self, count):
+        self.faces.observe(count)
+
+    def observe_encode(self, seconds, size):
+        self.observe("encode", seconds)
+        self.encode_bytes.observe(size)
+
+    def set_dnn_config(self, config):
+        """Record the inference backend configuration the camera's nets run with"""
+        self.dnn_config = dict(config)
+
+    def apply(self, observations):
+        """Replay observations recorded by a MetricsBuffer in another process"""
+        for method, args in observations:
+            getattr(self, method)(*args)
+
+    def viewer_connected(self):
+        with self.viewers_lock:
+            self.viewers += 1
+
+    def viewer_disconnected(self):
+        with self.viewers_lock:
+            self.viewers -= 1
+
+
+class MetricsBuffer:
+    """Stand-in for CameraMetrics in worker processes: records calls so they
+    can be shipped to the parent with each frame and replayed there."""
+
+    def __init__(self):
+        self.observations = []
+
+    def observe(self, stage, seconds):
+        self.observations.append(("observe", (stage, seconds)))
+
+    def inc(self, counter, amount=1):
+        self.observations.append(("inc", (counter, amount)))
+
+    def observe_faces(self, count):
+        self.observations.append(("observe_faces", (count,)))
+
+    def observe_encode(self, seconds, size):
+        self.observations.append(("observe_encode", (seconds, size)))
+
+    def set_dnn_config(self, config):
+        self.observations.append(("set_dnn_config", (config,)))
+
+    def drain(self):
+        observations, self.observations = self.observations, []
+        return observations
+
+
+class Timer:
+    """Context manager that reports its elapsed time to metrics.observe(stage)"""
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.metrics is not None:
+            self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cameras = {}
+
+    def camera(self, name):
+        with self.lock:
+            if name not in self.cameras:
+                self.cameras[name] = CameraMetrics(name)
+            return self.cameras[name]
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        cameras = list(self.cameras.values())
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for bound, count in hist.samples():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        histogram("safenest_stage_seconds", "Latency of each pipeline stage.",
+                  [(f'camera="{m.camera}",stage="{stage}"', hist)
+                   for m in cameras for stage, hist in list(m.stages.items())])
+        histogram("safenest_faces_per_frame", "Faces detected per frame.",
+                  [(f'camera="{m.camera}"', m.faces) for m in cameras])
+        histogram("safenest_encode_bytes", "Size of encoded JPEG frames.",
+                  [(f'camera="{m.camera}"', m.encode_bytes) for m in cameras])
+        for counter, help_text in (("frames_processed", "Frames run through the pipeline."),
+                                   ("frames_dropped", "Frames captured but never processed."),
+                                   ("frames_gated", "Frames that reused the previous result because nothing moved."),
+                                   ("gender_forward_calls", "Forward passes of the gender net.")):
+            lines.append(f"# HELP safenest_{counter}_total {help_text}")
+            lines.append(f"# TYPE safenest_{counter}_total counter")
+            for m in cameras:
+                lines.append(f'safenest_{counter}_total{{camera="{m.camera}"}} {m.counters.get(counter, 0)}')
+        lines.append("# HELP safenest_viewers Connected video stream viewers.")
+        lines.append("# TYPE safenest_viewers gauge")
+        for m in cameras:
+            lines.append(f'safenest_viewers{{camera="{m.camera}"}} {m.viewers}')
+        lines.append("# HELP safenest_dnn_info Inference backend configuration of each camera's nets.")
+        lines.append("# TYPE safenest_dnn_info gauge")
+        for m in cameras:
+            if m.dnn_config:
+                labels = ",".join(f'{key}="{m.dnn_config.get(key)}"'
+                                  for key in ("backend", "target", "precision", "threads"))
+                lines.append(f'safenest_dnn_info{{camera="{m.camera}",{labels}}} 1')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
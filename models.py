@@ -2,14 +2,128 @@ import cv2
 import numpy as np
 import urllib.request
 import os
+import time
 from pathlib import Path
 
-MODEL_URLS = {
-    'face_proto': 'YOUR_RAW_GITHUB_URL/opencv_face_detector.pbtxt',
-    'face_model': 'YOUR_RAW_GITHUB_URL/opencv_face_detector_uint8.pb',
-    'gender_proto': 'YOUR_RAW_GITHUB_URL/gender_deploy.prototxt',
-    'gender_model': 'YOUR_RAW_GITHUB_URL/gender_net.caffemodel'
+# Base URL the model files are downloaded from when they are not found locally
+MODEL_BASE_URL = os.environ.get('MODEL_BASE_URL', 'YOUR_RAW_GITHUB_URL')
+
+MODEL_FILES = {
+    'face_proto': 'opencv_face_detector.pbtxt',
+    'face_model': 'opencv_face_detector_uint8.pb',
+    'gender_proto': 'gender_deploy.prototxt',
+    'gender_model': 'gender_net.caffemodel'
+}
+
+MODEL_URLS = {key: f'{MODEL_BASE_URL}/{filename}' for key, filename in MODEL_FILES.items()}
+
+# Inference backend and target names accepted by DNN_BACKEND / DNN_TARGET
+DNN_BACKENDS = {
+    'default': cv2.dnn.DNN_BACKEND_DEFAULT,
+    'opencv': cv2.dnn.DNN_BACKEND_OPENCV,
+    'openvino': cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+    'cuda': cv2.dnn.DNN_BACKEND_CUDA,
+}
+DNN_TARGETS = {
+    'cpu': cv2.dnn.DNN_TARGET_CPU,
+    'opencl': cv2.dnn.DNN_TARGET_OPENCL,
+    'opencl_fp16': cv2.dnn.DNN_TARGET_OPENCL_FP16,
+    'cuda': cv2.dnn.DNN_TARGET_CUDA,
+    'cuda_fp16': cv2.dnn.DNN_TARGET_CUDA_FP16,
+    'myriad': cv2.dnn.DNN_TARGET_MYRIAD,
 }
+if hasattr(cv2.dnn, 'DNN_TARGET_CPU_FP16'):
+    DNN_TARGETS['cpu_fp16'] = cv2.dnn.DNN_TARGET_CPU_FP16
+DNN_PRECISIONS = ('fp32', 'fp16')
+
+# Configuration chosen by the last load_models() call in this process
+active_dnn_config = None
+
+def dnn_config_from_env():
+    """
+    Read the inference configuration from DNN_BACKEND (default, opencv,
+    openvino, cuda or auto), DNN_TARGET, DNN_THREADS and DNN_PRECISION
+    (fp32 or fp16).
+    """
+    return {
+        "backend": os.environ.get('DNN_BACKEND', 'default').lower(),
+        "target": os.environ.get('DNN_TARGET', 'cpu').lower(),
+        "threads": int(os.environ.get('DNN_THREADS', 0)) or None,
+        "precision": os.environ.get('DNN_PRECISION', 'fp32').lower(),
+    }
+
+def current_dnn_config():
+    """Return the configuration applied by the last load_models() call, or None"""
+    return dict(active_dnn_config) if active_dnn_config else None
+
+def resolve_target(target, precision):
+    """Return the target name for the precision, e.g. ('opencl', 'fp16') -> 'opencl_fp16'"""
+    if precision not in DNN_PRECISIONS:
+        raise ValueError(f"Unknown DNN precision {precision!r}, expected one of {DNN_PRECISIONS}")
+    base = target[:-len('_fp16')] if target.endswith('_fp16') else target
+    name = f"{base}_fp16" if precision == 'fp16' else base
+    if name not in DNN_TARGETS:
+        raise ValueError(f"DNN target {base!r} does not support {precision}")
+    return name
+
+def apply_dnn_config(net, config):
+    """Set the preferable backend and target of a net"""
+    if config["backend"] not in DNN_BACKENDS:
+        raise ValueError(f"Unknown DNN backend {config['backend']!r}, expected one of "
+                         f"{', '.join(DNN_BACKENDS)} or auto")
+    net.setPreferableBackend(DNN_BACKENDS[config["backend"]])
+    net.setPreferableTarget(DNN_TARGETS[resolve_target(config["target"], config["precision"])])
+
+def candidate_dnn_configs(threads=None):
+    """CPU backend/precision combinations this OpenCV build may support"""
+    candidates = []
+    for backend in ('opencv', 'openvino'):
+        # OpenCV's own backend always runs on the CPU, whatever it lists
+        if backend != 'opencv' and DNN_TARGETS['cpu'] not in cv2.dnn.getAvailableTargets(DNN_BACKENDS[backend]):
+            continue
+        for precision in DNN_PRECISIONS:
+            if precision == 'fp16' and 'cpu_fp16' not in DNN_TARGETS:
+                continue
+            candidates.append({"backend": backend, "target": "cpu", "threads": threads,
+                               "precision": precision})
+    return candidates
+
+def time_forward(net, blob, runs=5):
+    """Median seconds per forward pass, after one untimed pass"""
+    net.setInput(blob)
+    net.forward()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        net.setInput(blob)
+        net.forward()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+def select_dnn_config(faceNet, genderNet, threads=None, runs=5):
+    """
+    Benchmark both nets under every candidate CPU configuration and return
+    the fastest one, with its measured forward time in milliseconds.
+    """
+    face_blob = cv2.dnn.blobFromImage(np.zeros((300, 300, 3), dtype=np.uint8), 1.0, (300, 300),
+                                      [104, 117, 123], True, False)
+    gender_blob = cv2.dnn.blobFromImage(np.zeros((227, 227, 3), dtype=np.uint8), 1.0, (227, 227),
+                                        MODEL_MEAN_VALUES, swapRB=False)
+    best = None
+    for config in candidate_dnn_configs(threads):
+        try:
+            apply_dnn_config(faceNet, config)
+            apply_dnn_config(genderNet, config)
+            seconds = time_forward(faceNet, face_blob, runs) + time_forward(genderNet, gender_blob, runs)
+        except cv2.error as e:
+            print(f"Skipping DNN config {config}: {e}")
+            continue
+        print(f"DNN config {config['backend']}/{config['precision']}: {seconds * 1000:.2f} ms")
+        if best is None or seconds < best[1]:
+            best = (config, seconds)
+    if best is None:
+        raise RuntimeError("No DNN backend could run the models")
+    return dict(best[0], forward_ms=round(best[1] * 1000, 3))
 
 def download_model(url, filename):
     """Download model file if not present"""
@@ -23,23 +137,30 @@ def download_model(url, filename):
             return False
     return True
 
-def load_models():
-    """Load all required models"""
-    models_dir = Path(__file__).parent / 'models'
+def find_model(key):
+    """Return the path of a model file, downloading it into models/ if needed"""
+    base_dir = Path(__file__).parent
+    filename = MODEL_FILES[key]
+    for directory in (base_dir / 'models', base_dir):
+        if (directory / filename).exists():
+            return directory / filename
+    if MODEL_BASE_URL.startswith('YOUR_'):
+        raise RuntimeError(f"Model file {filename} not found and MODEL_BASE_URL is not configured")
+    models_dir = base_dir / 'models'
     models_dir.mkdir(exist_ok=True)
-    
-    model_paths = {
-        'face_proto': models_dir / 'opencv_face_detector.pbtxt',
-        'face_model': models_dir / 'opencv_face_detector_uint8.pb',
-        'gender_proto': models_dir / 'gender_deploy.prototxt',
-        'gender_model': models_dir / 'gender_net.caffemodel'
-    }
-    
-    # Download models if needed
-    for key, path in model_paths.items():
-        if not download_model(MODEL_URLS[key], str(path)):
-            raise RuntimeError(f"Failed to download {key}")
-    
+    if not download_model(MODEL_URLS[key], str(models_dir / filename)):
+        raise RuntimeError(f"Failed to download {key}")
+    return models_dir / filename
+
+def load_models(config=None):
+    """
+    Load all required models and apply the inference configuration
+    (dnn_config_from_env() by default) to both nets
+    """
+    global active_dnn_config
+    config = dict(config or dnn_config_from_env())
+    model_paths = {key: find_model(key) for key in MODEL_FILES}
+
     try:
         # Load models
         faceNet = cv2.dnn.readNet(
@@ -50,12 +171,20 @@ def load_models():
             str(model_paths['gender_model']),
             str(model_paths['gender_proto'])
         )
-        
-        return faceNet, genderNet
     except Exception as e:
         print(f"Error loading models: {e}")
         raise
 
+    if config["threads"]:
+        cv2.setNumThreads(config["threads"])
+    if config["backend"] == 'auto':
+        config = select_dnn_config(faceNet, genderNet, config["threads"])
+    apply_dnn_config(faceNet, config)
+    apply_dnn_config(genderNet, config)
+    config["threads"] = cv2.getNumThreads()
+    active_dnn_config = config
+    return faceNet, genderNet
+
 # Constants
 MODEL_MEAN_VALUES = (78.4263377603, 87.7689143744, 114.895847746)
 GENDER_LIST = ['Male', 'Female']
@@ -0,0 +1,226 @@
+import threading
+import time
+import cv2
+import numpy as np
+from metrics import REGISTRY, Timer
+from alerts import AlertEngine
+from history import DetectionHistory
+
+DEFAULT_DETECTION_INFO = {
+    "num_persons": 0,
+    "num_males": 0,
+    "num_females": 0,
+    "status": "No person detected",
+    "coverage_ratio": 0,
+    "coverage_status": "Coverage: 0.00",
+    "coverage_map": [],
+    "alerts": []
+}
+
+
+# OpenCV's own default JPEG quality
+DEFAULT_JPEG_QUALITY = 95
+# Requested widths are snapped to this step so clients cannot create unbounded tiers
+WIDTH_STEP = 32
+# Part header of the multipart/x-mixed-replace MJPEG stream; the header, the
+# cached JPEG bytes and the trailer are yielded separately so no per-viewer
+# copy of the frame is made
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+def encode_jpeg(frame, quality=DEFAULT_JPEG_QUALITY):
+    """Encode a frame as JPEG bytes, or return None if encoding fails"""
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ret:
+        print("Failed to encode frame")
+        return None
+    return buffer.tobytes()
+
+
+def normalize_tier(quality=None, width=None):
+    """Clamp and quantize a requested (quality, width) tier"""
+    if quality is not None:
+        quality = min(100, max(10, int(round(quality / 5.0)) * 5))
+        if quality == DEFAULT_JPEG_QUALITY:
+            quality = None
+    if width is not None:
+        width = max(WIDTH_STEP, int(width) // WIDTH_STEP * WIDTH_STEP)
+    return quality, width
+
+
+class EncodedFrame:
+    """
+    One published frame plus the JPEG encodings requested for it. Each
+    (quality, width) tier is encoded at most once, however many viewers ask
+    for it. The frame is either the annotated image or, for frames that
+    arrive already encoded, the default-tier JPEG bytes.
+    """
+
+    def __init__(self, frame, metrics=None):
+        self.lock = threading.Lock()
+        self.metrics = metrics
+        self.image = None
+        self.tiers = {}
+        if isinstance(frame, (bytes, bytearray)):
+            self.tiers[(None, None)] = bytes(frame)
+        else:
+            self.image = frame
+
+    def _source(self):
+        if self.image is None:
+            self.image = cv2.imdecode(np.frombuffer(self.tiers[(None, None)], np.uint8), cv2.IMREAD_COLOR)
+        return self.image
+
+    def get(self, quality=None, width=None):
+        """Return the JPEG bytes for a tier, encoding it on first request"""
+        key = normalize_tier(quality, width)
+        with self.lock:
+            if key not in self.tiers:
+                image = self._source()
+                quality, width = key
+                if width is not None and width >= image.shape[1]:
+                    # Never upscale; share the full-size tier at this quality
+                    self.tiers[key] = self.get_locked(image, quality)
+                else:
+                    if width is not None:
+                        height = max(1, int(round(image.shape[0] * width / image.shape[1])))
+                        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                    self.tiers[key] = self._encode(image, quality)
+            return self.tiers[key]
+
+    def get_locked(self, image, quality):
+        key = (quality, None)
+        if key not in self.tiers:
+            self.tiers[key] = self._encode(image, quality)
+        return self.tiers[key]
+
+    def _encode(self, image, quality):
+        start = time.perf_counter()
+        frame_bytes = encode_jpeg(image, quality or DEFAULT_JPEG_QUALITY)
+        if self.metrics is not None and frame_bytes is not None:
+            self.metrics.observe_encode(time.perf_counter() - start, len(frame_bytes))
+        return frame_bytes
+
+
+class FramePipeline:
+    """Reads a capture source in one background thread, runs the processing
+    callback once per frame and publishes the latest frame and detection info.
+
+    Any number of viewers can subscribe with wait_for_frame(); they all share
+    the same frames, so inference cost does not grow with the viewer count.
+    The callback returns (frame, detection_info) where frame is the annotated
+    image or already-encoded JPEG bytes; JPEG tiers are encoded on demand,
+    once per frame. Every published result passes through the camera's
+    AlertEngine, which adds the currently active alerts to it, and is
+    recorded in its DetectionHistory.
+    """
+
+    def __init__(self, capture, process_frame, name='default'):
+        self.capture = capture
+        self.process_frame = process_frame
+        self.name = name
+        self.metrics = REGISTRY.camera(name)
+        self.alerts = AlertEngine()
+        self.history = DetectionHistory()
+        # Optional ClipRecorder that saves frames around alerts
+        self.recorder = None
+        self.condition = threading.Condition()
+        self.frame = None
+        self.detection_info = dict(DEFAULT_DETECTION_INFO)
+        self.sequence = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"frame-pipeline-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def _run(self):
+        while self.running:
+            try:
+                with Timer(self.metrics, "capture"):
+                    success, frame = self.capture.read()
+                if not success:
+                    print("Failed to grab frame")
+                    break
+                frame, detection_info = self.process_frame(frame)
+                if frame is None:
+                    self.metrics.inc("frames_dropped")
+                    continue
+                self.publish(frame, detection_info)
+            except Exception as e:
+                print(f"Error in frame pipeline: {e}")
+                time.sleep(0.01)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def publish(self, frame, detection_info):
+        now = time.time()
+        if self.alerts is not None:
+            detection_info = dict(detection_info, alerts=self.alerts.update(detection_info, now))
+        self.history.add(detection_info, now)
+        encoded = EncodedFrame(frame, self.metrics)
+        self.metrics.inc("frames_processed")
+        with self.condition:
+            self.frame = encoded
+            self.detection_info = detection_info
+            self.sequence += 1
+            self.condition.notify_all()
+        if self.recorder is not None:
+            frame_bytes = encoded.get()
+            if frame_bytes is not None:
+                self.recorder.add(now, frame_bytes, detection_info)
+
+    def get_frame(self, quality=None, width=None):
+        """Return the latest (frame_bytes, detection_info) without waiting."""
+        with self.condition:
+            frame, detection_info = self.frame, self.detection_info
+        if frame is None:
+            return None, detection_info
+        return frame.get(quality, width), detection_info
+
+    def get_info(self):
+        """Return the latest detection info without encoding a frame."""
+        with self.condition:
+            return self.detection_info
+
+    def wait_for_info(self, last_sequence, timeout=1.0):
+        """Like wait_for_frame() but only returns (sequence, detection_info).
+
+        detection_info is None if no newer result arrived before the timeout.
+        """
+        with self.condition:
+            if self.sequence == last_sequence and self.running:
+                self.condition.wait(timeout)
+            if self.sequence == last_sequence:
+                return last_sequence, None
+            return self.sequence, self.detection_info
+
+    def wait_for_frame(self, last_sequence, timeout=1.0, quality=None, width=None):
+        """Block until a frame newer than last_sequence is published.
+
+        Returns (sequence, frame_bytes, detection_info); frame_bytes is None
+        if the timeout expired or the pipeline stopped. quality and width
+        select the JPEG tier.
+        """
+        with self.condition:
+            if self.sequence == last_sequence and self.running:
+                self.condition.wait(timeout)
+            if self.sequence == last_sequence:
+                return last_sequence, None, self.detection_info
+            sequence, frame, detection_info = self.sequence, self.frame, self.detection_info
+        return sequence, frame.get(quality, width), detection_info
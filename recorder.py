@@ -0,0 +1,175 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+CLIP_FORMATS = ('jpeg', 'avi')
+
+
+class ClipWriter:
+    """Writes one clip as a JPEG sequence or an MJPEG AVI, plus a JSON sidecar"""
+
+    def __init__(self, path, clip_format, alerts, fps):
+        self.path = path
+        self.clip_format = clip_format
+        self.fps = fps
+        self.alerts = list(alerts)
+        self.frames = []
+        self.video = None
+        if clip_format == 'jpeg':
+            os.makedirs(path, exist_ok=True)
+
+    def write(self, timestamp, jpeg, detection_info):
+        index = len(self.frames)
+        if self.clip_format == 'jpeg':
+            with open(os.path.join(self.path, f"{index:06d}.jpg"), 'wb') as f:
+                f.write(jpeg)
+        else:
+            # OpenCV cannot mux existing JPEG bytes, so frames are re-encoded
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                return
+            if self.video is None:
+                height, width = frame.shape[:2]
+                self.video = cv2.VideoWriter(self.path + '.avi', cv2.VideoWriter_fourcc(*'MJPG'),
+                                             self.fps, (width, height))
+            self.video.write(frame)
+        self.frames.append(dict(detection_info, index=index, timestamp=timestamp))
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+        sidecar = os.path.join(self.path, 'clip.json') if self.clip_format == 'jpeg' else self.path + '.json'
+        with open(sidecar, 'w') as f:
+            json.dump({
+                "start": self.frames[0]["timestamp"] if self.frames else None,
+                "end": self.frames[-1]["timestamp"] if self.frames else None,
+                "fps": self.fps,
+                "alerts": self.alerts,
+                "frames": self.frames,
+            }, f, indent=2)
+        return sidecar
+
+
+class ClipRecorder:
+    """
+    Keeps the last pre_seconds of encoded frames in a ring buffer capped at
+    max_bytes. When an alert starts, that buffer and the next post_seconds of
+    frames are written to a clip in directory; a new alert during a clip
+    extends it. add() only appends to in-memory structures: all disk I/O and
+    re-encoding happens on a background writer thread, and frames are dropped
+    rather than queued without bound if the disk cannot keep up.
+    """
+
+    def __init__(self, directory, pre_seconds=10.0, post_seconds=10.0, max_bytes=64 * 1024 * 1024,
+                 clip_format='jpeg'):
+        if clip_format not in CLIP_FORMATS:
+            raise ValueError(f"Unknown clip format {clip_format!r}, expected one of {CLIP_FORMATS}")
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+        self.clip_format = clip_format
+        self.buffer = collections.deque()
+        self.buffer_bytes = 0
+        self.seen_alerts = set()
+        self.recording_until = None
+        self.queue = queue.Queue()
+        self.queued_bytes = 0
+        self.queued_lock = threading.Lock()
+        self.dropped_frames = 0
+        self.clips = []
+        self.thread = None
+
+    def add(self, timestamp, jpeg, detection_info):
+        """Record one published frame; called from the pipeline thread"""
+        self.buffer.append((timestamp, jpeg, detection_info))
+        self.buffer_bytes += len(jpeg)
+        while self.buffer and (self.buffer_bytes > self.max_bytes
+                               or self.buffer[0][0] < timestamp - self.pre_seconds):
+            self.buffer_bytes -= len(self.buffer.popleft()[1])
+
+        alerts = detection_info.get("alerts", [])
+        new_alerts = [alert for alert in alerts if alert["id"] not in self.seen_alerts]
+        self.seen_alerts = {alert["id"] for alert in alerts}
+
+        if self.recording_until is None:
+            if new_alerts:
+                self._start_writer()
+                frames = list(self.buffer)
+                self._put(("start", timestamp, new_alerts, frames), sum(len(f[1]) for f in frames))
+                self.recording_until = timestamp + self.post_seconds
+            return
+        if new_alerts:
+            self.recording_until = max(self.recording_until, timestamp + self.post_seconds)
+            self._put(("alerts", new_alerts), 0)
+        if not self._put(("frame", timestamp, jpeg, detection_info), len(jpeg)):
+            self.dropped_frames += 1
+        if timestamp >= self.recording_until:
+            self._put(("end",), 0)
+            self.recording_until = None
+
+    def _put(self, item, size):
+        """Queue an item for the writer; frames are refused while too many bytes are pending"""
+        with self.queued_lock:
+            if item[0] == "frame" and self.queued_bytes + size > self.max_bytes:
+                return False
+            self.queued_bytes += size
+        self.queue.put_nowait((item, size))
+        return True
+
+    def _start_writer(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._write_clips, name="clip-writer", daemon=True)
+            self.thread.start()
+
+    def _write_clips(self):
+        clip = None
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            item, size = entry
+            try:
+                kind = item[0]
+                if kind == "start":
+                    _, timestamp, alerts, frames = item
+                    # Created here so add() never touches the disk
+                    os.makedirs(self.directory, exist_ok=True)
+                    clip = self._open_clip(timestamp, alerts, frames)
+                    for frame in frames:
+                        clip.write(*frame)
+                elif kind == "frame" and clip is not None:
+                    clip.write(*item[1:])
+                elif kind == "alerts" and clip is not None:
+                    clip.alerts.extend(item[1])
+                elif kind == "end" and clip is not None:
+                    self.clips.append(clip.close())
+                    clip = None
+            except Exception as e:
+                print(f"Error writing clip: {e}")
+            finally:
+                with self.queued_lock:
+                    self.queued_bytes -= size
+        if clip is not None:
+            self.clips.append(clip.close())
+
+    def _open_clip(self, timestamp, alerts, frames):
+        name = time.strftime('%Y%m%d-%H%M%S', time.localtime(timestamp))
+        name += f"_{alerts[0]['type']}"
+        # Frame rate of the pre-event frames, for the AVI container
+        fps = 10.0
+        if len(frames) > 1 and frames[-1][0] > frames[0][0]:
+            fps = (len(frames) - 1) / (frames[-1][0] - frames[0][0])
+        return ClipWriter(os.path.join(self.directory, name), self.clip_format, alerts, fps)
+
+    def close(self):
+        """Finish the clip in progress and stop the writer thread"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5.0)
+            self.thread = None
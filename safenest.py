@@ -0,0 +1,336 @@
+"""
+SafeNest detection engine. DetectionPipeline is the one implementation of
+face detection, gender classification, coverage, status, overlay and JPEG
+encoding used by the streaming server, the upload servers and the CLI
+tools, so they share thresholds and every performance option.
+"""
+import collections
+import os
+import threading
+import time
+import cv2
+from detection import (detect_faces, draw_face_boxes, count_genders, coverage_map,
+                       FrameBuffers, TiledFaceDetector, MAX_GENDER_BATCH, CONF_THRESHOLD,
+                       SURROUNDED_MIN_MALES, COVERAGE_WARNING_RATIO, COVERAGE_FULL_RATIO)
+from tracking import FaceTracker, KeyframeDetector, MotionGate
+from pipeline import encode_jpeg
+from metrics import Timer
+from inference import InferencePool
+from models import load_models
+
+# Stages of DetectionPipeline, in the order they run
+STAGES = ('detect', 'classify', 'coverage', 'status', 'render', 'encode')
+
+# Result of DetectionPipeline.process(); frame is the annotated frame (the
+# input frame if render is disabled) and jpeg is None unless encode is enabled
+DetectionResult = collections.namedtuple('DetectionResult', 'bboxes genders detection_info frame jpeg')
+
+
+def options_from_env():
+    """DetectionPipeline options from the environment, shared by every entry point"""
+    return {
+        "gender_batch_size": int(os.environ.get('GENDER_BATCH_SIZE', MAX_GENDER_BATCH)),
+        # Seconds a tracked face keeps its gender before it is re-classified
+        "gender_cache_ttl": float(os.environ.get('GENDER_CACHE_TTL', 2.0)),
+        # Run full face detection every N frames ('auto' adapts N to inference time)
+        "detect_interval": os.environ.get('DETECT_INTERVAL', '1').lower(),
+        # Coverage grid size (N x N cells) and optional thumbnail width for the check
+        "coverage_grid": int(os.environ.get('COVERAGE_GRID', 3)),
+        "coverage_max_width": int(os.environ.get('COVERAGE_MAX_WIDTH', 0)) or None,
+        # Inference threads per camera, each with its own copy of the nets
+        "inference_threads": int(os.environ.get('INFERENCE_THREADS', 1)),
+        # Reuse blobs and scratch images between frames instead of allocating them
+        "reuse_buffers": os.environ.get('REUSE_BUFFERS', 'True').lower() == 'true',
+        # Skip inference on frames where less than this fraction of pixels
+        # changed (0 disables the gate); a frame is analyzed at least every
+        # MOTION_HEARTBEAT seconds
+        "motion_sensitivity": float(os.environ.get('MOTION_SENSITIVITY', 0)),
+        "motion_heartbeat": float(os.environ.get('MOTION_HEARTBEAT', 2.0)),
+        # Search frames larger than this many pixels in overlapping tiles (0 = off)
+        "detect_tile_size": int(os.environ.get('DETECT_TILE_SIZE', 0)),
+    }
+
+
+# Options for pipelines fed unrelated images, e.g. uploads: nothing may
+# carry over from one image to the next, so no gender cache, no propagated
+# boxes and no motion gate
+SINGLE_IMAGE_OPTIONS = {"gender_cache_ttl": 0, "detect_interval": 1, "motion_sensitivity": 0}
+
+
+def person_status(num_persons, num_males, num_females):
+    status = "No person detected"
+    if num_persons >= 1:
+        if num_females == 1:
+            if num_males >= SURROUNDED_MIN_MALES:
+                status = "Warning: Woman is surrounded by men"
+            else:
+                status = "Woman is alone"
+        elif num_persons >= 2:
+            status = "Multiple persons detected"
+    return status
+
+
+def coverage_status(coverage_ratio):
+    if coverage_ratio >= COVERAGE_FULL_RATIO:
+        return "Warning: 100% display is covered!"
+    if coverage_ratio >= COVERAGE_WARNING_RATIO:
+        return "Warning: Screen covered over 40%!"
+    return f"Coverage: {coverage_ratio:.2f}"
+
+
+class DetectionPipeline:
+    """
+    Per-camera detection state: face detection, cached gender classification,
+    coverage check and the annotated JPEG. Each camera gets its own instance
+    so trackers never mix faces from different sources. With
+    inference_threads > 1, detection and gender batches run on a pool of
+    threads that each hold their own copy of the nets. With reuse_buffers,
+    blobs and scratch images are allocated once per resolution and reused.
+    With motion_sensitivity > 0, frames where nothing moved reuse the
+    previous result instead of running the nets (see MotionGate). With
+    detect_tile_size > 0, frames larger than a tile are searched tile by
+    tile so small, distant faces are found (see TiledFaceDetector).
+
+    Each stage in STAGES can be switched off with stages, e.g. an upload
+    endpoint that only reports counts can skip render and encode. Without
+    classify every face counts as unknown, without coverage the ratio is 0
+    and without status the status strings are None. The nets are loaded
+    with load_models() if none are given.
+    """
+
+    def __init__(self, faceNet=None, genderNet=None, conf_threshold=CONF_THRESHOLD, padding=20,
+                 gender_batch_size=MAX_GENDER_BATCH, gender_cache_ttl=2.0, detect_interval='1',
+                 coverage_grid=3, coverage_max_width=None, inference_threads=1, reuse_buffers=False, motion_sensitivity=0.0,
+                 motion_heartbeat=2.0, detect_tile_size=0, stages=STAGES, metrics=None):
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+        if faceNet is None or genderNet is None:
+            faceNet, genderNet = load_models()
+        self.stages = frozenset(stages)
+        self.faceNet = faceNet
+        self.genderNet = genderNet
+        self.conf_threshold = conf_threshold
+        self.padding = padding
+        self.gender_batch_size = gender_batch_size
+        self.coverage_grid = coverage_grid
+        self.coverage_max_width = coverage_max_width
+        self.metrics = metrics
+        self.pool = InferencePool(inference_threads) if int(inference_threads) > 1 else None
+        self.buffers = FrameBuffers() if reuse_buffers else None
+        self.motion_gate = (MotionGate(motion_sensitivity, motion_heartbeat, buffers=self.buffers)
+                            if motion_sensitivity > 0 else None)
+        self.last_result = None
+        self.tiled_detector = TiledFaceDetector(detect_tile_size) if detect_tile_size else None
+        detect_interval = str(detect_interval).lower()
+        self.face_tracker = FaceTracker(gender_ttl=gender_cache_ttl)
+        self.face_detector = KeyframeDetector(self.detect,
+                                              interval=1 if detect_interval == 'auto' else int(detect_interval),
+                                              adaptive=detect_interval == 'auto', buffers=self.buffers)
+
+    @classmethod
+    def from_env(cls, faceNet=None, genderNet=None, **options):
+        """Pipeline configured from the environment (see options_from_env); options override it"""
+        return cls(faceNet, genderNet, **dict(options_from_env(), **options))
+
+    @classmethod
+    def for_single_images(cls, faceNet=None, genderNet=None, **options):
+        """Pipeline configured from the environment for unrelated images (see SINGLE_IMAGE_OPTIONS)"""
+        return cls.from_env(faceNet, genderNet, **dict(options, **SINGLE_IMAGE_OPTIONS))
+
+    def detect(self, frame):
+        try:
+            if self.tiled_detector is not None:
+                if self.pool is not None:
+                    bboxes, _ = self.pool.submit(lambda faceNet, genderNet: self.tiled_detector(
+                        faceNet, frame, self.conf_threshold)).result()
+                else:
+                    bboxes, _ = self.tiled_detector(self.faceNet, frame, self.conf_threshold)
+            elif self.pool is not None:
+                bboxes, _ = self.pool.detect_faces(frame, self.conf_threshold)
+            else:
+                bboxes, _ = detect_faces(self.faceNet, frame, self.conf_threshold, self.buffers)
+            return bboxes.tolist()
+        except Exception as e:
+            print(f"Error in face detection: {e}")
+            return []
+
+    def coverage(self, frame, variance_threshold=100.0):
+        """Return (coverage_ratio, covered_cells) for the frame."""
+        try:
+            ratio, covered = coverage_map(frame, self.coverage_grid, self.coverage_grid,
+                                          variance_threshold, self.coverage_max_width, self.buffers)
+            return ratio, covered.tolist()
+        except Exception as e:
+            print(f"Error in coverage detection: {e}")
+            return 0.0, []
+
+    def reset(self):
+        """Forget tracked faces, e.g. before jumping to another part of a video"""
+        self.face_tracker.reset()
+        self.face_detector.reset()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        self.last_result = None
+
+    def analyze(self, frame, now=None):
+        """
+        Run detection on one frame without drawing anything. now is the frame
+        time used for the gender cache (defaults to the wall clock).
+        Returns (bboxes, genders, detection_info).
+        """
+        if self.motion_gate is not None:
+            with Timer(self.metrics, "motion"):
+                changed = self.motion_gate(frame, now)
+            if not changed and self.last_result is not None:
+                if self.metrics is not None:
+                    self.metrics.inc("frames_gated")
+                return self.last_result
+
+        # Process frame with face detection
+        bboxes = []
+        if 'detect' in self.stages:
+            with Timer(self.metrics, "detect"):
+                bboxes = self.face_detector(frame)
+
+        numPersons = len(bboxes)
+
+        # Classify new or stale faces in batched forward passes; tracked faces
+        # reuse their cached gender
+        genders = [None] * numPersons
+        if 'classify' in self.stages:
+            with Timer(self.metrics, "gender"):
+                try:
+                    genders = self.face_tracker.classify(self.pool or self.genderNet, frame, bboxes, self.padding,
+                                                         self.gender_batch_size, now, self.buffers)
+                except Exception as e:
+                    print(f"Error processing faces: {e}")
+            if self.metrics is not None:
+                self.metrics.inc("gender_forward_calls", self.face_tracker.forward_calls)
+        if self.metrics is not None:
+            self.metrics.observe_faces(numPersons)
+
+        numMales, numFemales = count_genders(genders)
+
+        # Check coverage
+        coverage_ratio, covered_cells = 0.0, []
+        if 'coverage' in self.stages:
+            with Timer(self.metrics, "coverage"):
+                coverage_ratio, covered_cells = self.coverage(frame)
+
+        detection_info = {
+            "num_persons": numPersons,
+            "num_males": numMales,
+            "num_females": numFemales,
+            "status": None,
+            "coverage_ratio": coverage_ratio,
+            "coverage_status": None,
+            "coverage_map": covered_cells
+        }
+        if 'status' in self.stages:
+            detection_info["status"] = person_status(numPersons, numMales, numFemales)
+            detection_info["coverage_status"] = coverage_status(coverage_ratio)
+        self.last_result = (bboxes, genders, detection_info)
+        return self.last_result
+
+    def annotate(self, frame):
+        """Run detection on one frame and return (annotated_frame, detection_info)."""
+        # Boxes are drawn in place, after the face crops and coverage have
+        # been taken from the clean frame
+        bboxes, genders, detection_info = self.analyze(frame)
+        return self._render(frame, bboxes, genders, detection_info), detection_info
+
+    def _render(self, frame, bboxes, genders, detection_info):
+        if 'render' not in self.stages:
+            return frame
+        with Timer(self.metrics, "render"):
+            return self.render(frame, bboxes, genders, detection_info)
+
+    @staticmethod
+    def render(frame, bboxes, genders, detection_info):
+        """Draw boxes, gender labels and the status overlay onto the frame in place; needs no nets"""
+        numPersons = detection_info["num_persons"]
+        numMales = detection_info["num_males"]
+        numFemales = detection_info["num_females"]
+        status = detection_info["status"]
+        coverage_status = detection_info["coverage_status"]
+
+        frameFace = draw_face_boxes(frame, bboxes, copy=False)
+        for bbox, gender in zip(bboxes, genders):
+            if gender is None:
+                continue
+            # Add gender label to frame
+            label = f"{gender}"
+            cv2.putText(frameFace, label, (bbox[0], bbox[1]-10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2, cv2.LINE_AA)
+
+        # Add overlay text to frame
+        cv2.putText(frameFace, f"Persons: {numPersons}", (10, 30),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.putText(frameFace, f"Males: {numMales}", (10, 60),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+        cv2.putText(frameFace, f"Females: {numFemales}", (10, 90),
+                  cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 2)
+        if status is not None:
+            cv2.putText(frameFace, status, (10, 120),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        if coverage_status is not None:
+            cv2.putText(frameFace, coverage_status, (10, 150),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        return frameFace
+
+    def encode(self, frame):
+        """Encode the frame as JPEG, or return None if the encode stage is off"""
+        if 'encode' not in self.stages:
+            return None
+        start = time.perf_counter()
+        frame_bytes = encode_jpeg(frame)
+        if self.metrics is not None and frame_bytes is not None:
+            self.metrics.observe_encode(time.perf_counter() - start, len(frame_bytes))
+        return frame_bytes
+
+    def process(self, frame, now=None):
+        """Run every enabled stage on one frame and return a DetectionResult"""
+        bboxes, genders, detection_info = self.analyze(frame, now)
+        frameFace = self._render(frame, bboxes, genders, detection_info)
+        return DetectionResult(bboxes, genders, detection_info, frameFace, self.encode(frameFace))
+
+    def __call__(self, frame):
+        """
+        Run detection on one frame and return (jpeg_bytes, detection_info);
+        with encode off the frame itself is returned for FramePipeline to
+        encode on demand.
+        """
+        frameFace, detection_info = self.annotate(frame)
+        if 'encode' not in self.stages:
+            return frameFace, detection_info
+        return self.encode(frameFace), detection_info
+
+
+class SingleImagePipeline:
+    """
+    DetectionPipeline shared by the requests of an upload server. It is
+    created on the first image, so importing the server loads no models, and
+    each image is analyzed under a lock on a freshly reset pipeline.
+    options are passed to DetectionPipeline.for_single_images.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.pipeline = None
+        self.lock = threading.Lock()
+
+    def _run(self, method, frame):
+        with self.lock:
+            if self.pipeline is None:
+                self.pipeline = DetectionPipeline.for_single_images(**self.options)
+            self.pipeline.reset()
+            return getattr(self.pipeline, method)(frame)
+
+    def analyze(self, frame):
+        """DetectionPipeline.analyze on one image; returns (bboxes, genders, detection_info)"""
+        return self._run('analyze', frame)
+
+    def process(self, frame):
+        """DetectionPipeline.process on one image; returns a DetectionResult"""
+        return self._run('process', frame)
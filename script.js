@@ -10,6 +10,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     let isMonitoring = false;
     let updateInterval = null;
+    let detectionEvents = null;
+    // Ids of the alerts already shown, so each alert pops up once
+    let shownAlerts = new Set();
 
     // Start/Stop video monitoring
     function toggleMonitoring() {
@@ -20,7 +23,7 @@ document.addEventListener('DOMContentLoaded', function() {
             startBtn.classList.remove('btn-primary');
             startBtn.classList.add('btn-danger');
             isMonitoring = true;
-            updateInterval = setInterval(updateDetectionInfo, 1000);
+            subscribeDetectionInfo();
         } else {
             // Stop monitoring
             videoStream.src = '';
@@ -28,39 +31,87 @@ document.addEventListener('DOMContentLoaded', function() {
             startBtn.classList.remove('btn-danger');
             startBtn.classList.add('btn-primary');
             isMonitoring = false;
-            clearInterval(updateInterval);
+            unsubscribeDetectionInfo();
             resetDetectionInfo();
         }
     }
 
+    // Receive detection results as the server pushes them, falling back to
+    // polling in browsers without EventSource
+    function subscribeDetectionInfo() {
+        if (!window.EventSource) {
+            updateInterval = setInterval(updateDetectionInfo, 1000);
+            return;
+        }
+        detectionEvents = new EventSource('/detection_stream');
+        detectionEvents.onmessage = event => applyDetectionInfo(JSON.parse(event.data));
+        detectionEvents.onerror = () => {
+            // EventSource reconnects on its own unless the server closed the stream
+            if (detectionEvents.readyState === EventSource.CLOSED) {
+                handleConnectionError('Detection stream closed');
+            }
+        };
+    }
+
+    function unsubscribeDetectionInfo() {
+        if (detectionEvents) {
+            detectionEvents.close();
+            detectionEvents = null;
+        }
+        clearInterval(updateInterval);
+    }
+
     // Update detection information
     function updateDetectionInfo() {
         fetch('/detection_info')
             .then(response => response.json())
-            .then(data => {
-                personCountText.textContent = `Person Count: ${data.num_persons}`;
-                maleCountText.textContent = `Males: ${data.num_males}`;
-                femaleCountText.textContent = `Females: ${data.num_females}`;
-                statusText.textContent = data.status;
-                coverageText.textContent = data.coverage_status;
-
-                // Update warning styles
-                statusText.classList.toggle('warning', 
-                    data.status.includes('surrounded') || data.status.includes('Warning'));
-                coverageText.classList.toggle('warning', data.coverage_ratio >= 0.4);
-
-                // Show alerts for critical situations
-                if (data.status.includes('surrounded') || data.coverage_ratio >= 0.4) {
-                    showAlert(data.status);
-                }
-            })
-            .catch(err => {
-                console.error('Error fetching detection info:', err);
-                showAlert('Error connecting to server. Please check if the server is running.');
-                if (isMonitoring) {
-                    toggleMonitoring();
-                }
-            });
+            .then(applyDetectionInfo)
+            .catch(handleConnectionError);
+    }
+
+    function applyDetectionInfo(data) {
+        personCountText.textContent = `Person Count: ${data.num_persons}`;
+        maleCountText.textContent = `Males: ${data.num_males}`;
+        femaleCountText.textContent = `Females: ${data.num_females}`;
+        // Warnings follow the debounced alerts, not the raw per-frame status,
+        // so a single misclassified frame does not make them flicker
+        const alerts = data.alerts || [];
+        const active = new Set(alerts.map(alert => alert.type));
+        const surrounded = active.has('woman_surrounded');
+        const covered = active.has('camera_covered') || active.has('camera_fully_covered');
+
+        if (surrounded) {
+            statusText.textContent = 'Warning: Woman is surrounded by men';
+        } else if (data.status.startsWith('Warning')) {
+            // Not (yet) confirmed by the alert; the frame still has several people
+            statusText.textContent = 'Multiple persons detected';
+        } else {
+            statusText.textContent = data.status;
+        }
+        if (active.has('camera_fully_covered')) {
+            coverageText.textContent = 'Warning: 100% display is covered!';
+        } else if (covered) {
+            coverageText.textContent = 'Warning: Screen covered over 40%!';
+        } else {
+            coverageText.textContent = `Coverage: ${Number(data.coverage_ratio).toFixed(2)}`;
+        }
+
+        // Update warning styles
+        statusText.classList.toggle('warning', surrounded);
+        coverageText.classList.toggle('warning', covered);
+
+        // Show each debounced alert once, when it starts
+        alerts.filter(alert => !shownAlerts.has(alert.id))
+              .forEach(alert => showAlert(alert.message));
+        shownAlerts = new Set(alerts.map(alert => alert.id));
+    }
+
+    function handleConnectionError(err) {
+        console.error('Error fetching detection info:', err);
+        showAlert('Error connecting to server. Please check if the server is running.');
+        if (isMonitoring) {
+            toggleMonitoring();
+        }
     }
 
     // Reset detection information
@@ -1,20 +1,23 @@
 from flask import Flask, request, Response
 import cv2
 import numpy as np
-from woman_info1 import getFaceBox, net  # Ensure net model is loaded in woman_info.py
+from safenest import SingleImagePipeline
 
 app = Flask(__name__)
 
+pipeline = SingleImagePipeline()
+
 @app.route('/upload', methods=['POST'])
 def upload_image():
     img_data = request.data
     np_arr = np.frombuffer(img_data, np.uint8)
     frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    if frame is None:
+        return "Invalid image", 400
 
-    # Run detection
-    frame, bboxes = getFaceBox(net, frame)
-    _, jpeg = cv2.imencode('.jpg', frame)
-    return Response(jpeg.tobytes(), mimetype='image/jpeg')
+    # Run detection and return the annotated image
+    result = pipeline.process(frame)
+    return Response(result.jpeg, mimetype='image/jpeg')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -1,164 +1,222 @@
-from flask import Flask, Response, render_template_string
-import cv2
+from flask import Flask, Blueprint, Response, render_template_string, jsonify, abort, request
 import numpy as np
+import json
 import os
-from pathlib import Path
-from models import load_models, MODEL_MEAN_VALUES, GENDER_LIST
-
-app = Flask(__name__)
+import threading
+import time
+from models import load_models, current_dnn_config
+from pipeline import FramePipeline, DEFAULT_DETECTION_INFO, MJPEG_PART_HEADER
+from safenest import DetectionPipeline, options_from_env
+from cameras import CameraRegistry, load_camera_config, open_source
+from recorder import ClipRecorder
+from framebus import BusPipeline
+from history import DetectionHistory
+from metrics import REGISTRY
+from detection import detect_faces, classify_genders
+
+# Routes live on a blueprint so create_app() can build fresh apps
+bp = Blueprint('safenest', __name__)
 
 # Environment variables for configuration
 PORT = int(os.environ.get('PORT', 8000))
 DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
-
-# Initialize video capture
-try:
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        raise RuntimeError("Could not open video source")
-except Exception as e:
-    print(f"Error initializing video capture: {e}")
-
-# Load models
-try:
-    faceNet, genderNet = load_models()
-except Exception as e:
-    print(f"Error loading models: {e}")
+DEFAULT_CAMERA_ID = 'default'
+
+# DetectionPipeline options (GENDER_BATCH_SIZE, DETECT_INTERVAL, ...), the
+# same for every camera and entry point
+PROCESSOR_OPTIONS = options_from_env()
+
+# Save clips around alerts to RECORD_DIR/<cam_id> (unset disables recording)
+RECORD_DIR = os.environ.get('RECORD_DIR')
+RECORD_PRE_SECONDS = float(os.environ.get('RECORD_PRE_SECONDS', 10))
+RECORD_POST_SECONDS = float(os.environ.get('RECORD_POST_SECONDS', 10))
+RECORD_MAX_MB = float(os.environ.get('RECORD_MAX_MB', 64))
+RECORD_FORMAT = os.environ.get('RECORD_FORMAT', 'jpeg').lower()
+
+def make_recorder(cam_id):
+    if not RECORD_DIR:
+        return None
+    return ClipRecorder(os.path.join(RECORD_DIR, cam_id), RECORD_PRE_SECONDS, RECORD_POST_SECONDS,
+                        int(RECORD_MAX_MB * 1024 * 1024), RECORD_FORMAT)
+
+# Name of the shared memory frame bus to read the default camera from, so
+# several web workers share one capture and inference process (framebus.py)
+FRAME_BUS = os.environ.get('FRAME_BUS')
+
+# Cameras from CAMERAS / CAMERAS_FILE each run in their own worker process;
+# without them the server watches device 0 in-process as before
+camera_registry = CameraRegistry(load_camera_config(), PROCESSOR_OPTIONS, make_recorder)
+
+# The default camera and the nets are created on first use (or by the
+# warm-up thread) so importing this module never touches hardware or disk
+cap = None
+nets = None
+state_lock = threading.Lock()
+
+# Progress of the warm-up, served by /ready
+startup_state = {
+    "models_loaded": False,
+    "camera_opened": False,
+    "warmed_up": False,
+    "warm_up_seconds": None,
+    "error": None,
+}
+
+def get_nets():
+    """Return (faceNet, genderNet), loading them on first use"""
+    global nets
+    with state_lock:
+        if nets is None:
+            nets = load_models()
+            startup_state["models_loaded"] = True
+            REGISTRY.camera(DEFAULT_CAMERA_ID).set_dnn_config(current_dnn_config())
+        return nets
+
+def get_capture():
+    """Return the default video capture, opening it on first use"""
+    global cap
+    with state_lock:
+        if cap is None:
+            # Latest-frame-wins: inference always gets the newest frame and
+            # the frames it skips are counted as dropped
+            cap = open_source(0, REGISTRY.camera(DEFAULT_CAMERA_ID))
+            startup_state["camera_opened"] = cap.isOpened()
+            if not cap.isOpened():
+                print("Error initializing video capture: Could not open video source")
+        return cap
 
 padding = 20
 
-def getFaceBox(net, frame, conf_threshold=0.7):
+processor = None
+
+def get_processor():
+    """Return the default camera's DetectionPipeline, creating it on first use"""
+    global processor
+    faceNet, genderNet = get_nets()
+    with state_lock:
+        if processor is None:
+            processor = DetectionPipeline(faceNet, genderNet, padding=padding,
+                                          metrics=REGISTRY.camera(DEFAULT_CAMERA_ID), **PROCESSOR_OPTIONS)
+        return processor
+
+def process_frame(frame):
+    """Run detection on one frame and return (jpeg_bytes, detection_info)."""
+    return get_processor().annotate(frame)
+
+pipeline = None
+pipeline_lock = threading.Lock()
+
+def get_camera(cam_id=None):
+    """
+    Return the shared pipeline for a camera, starting it on first use.
+    cam_id defaults to the first configured camera; raises KeyError if unknown.
+    """
+    global pipeline
+    if camera_registry:
+        return camera_registry.get(cam_id or camera_registry.ids()[0])
+    if cam_id not in (None, DEFAULT_CAMERA_ID):
+        raise KeyError(cam_id)
+    with pipeline_lock:
+        if pipeline is None and FRAME_BUS:
+            # The producer process owns the camera, the nets and the recorder
+            pipeline = BusPipeline(FRAME_BUS, name=DEFAULT_CAMERA_ID)
+        elif pipeline is None:
+            pipeline = FramePipeline(get_capture(), process_frame, name=DEFAULT_CAMERA_ID)
+            pipeline.recorder = make_recorder(DEFAULT_CAMERA_ID)
+        if not pipeline.running:
+            pipeline.start()
+        return pipeline
+
+def peek_camera(cam_id=None):
+    """
+    Return the pipeline for a camera without starting it (None if the default
+    camera was never started); raises KeyError for unknown ids.
+    """
+    if camera_registry:
+        return camera_registry.peek(cam_id or camera_registry.ids()[0])
+    if cam_id not in (None, DEFAULT_CAMERA_ID):
+        raise KeyError(cam_id)
+    return pipeline
+
+def generate_frames(cam_id=None, quality=None, width=None):
+    camera = get_camera(cam_id)
+    sequence = 0
+    camera.metrics.viewer_connected()
     try:
-        frameOpencvDnn = frame.copy()
-        frameHeight = frameOpencvDnn.shape[0]
-        frameWidth = frameOpencvDnn.shape[1]
-        blob = cv2.dnn.blobFromImage(frameOpencvDnn, 1.0, (300, 300), [104, 117, 123], True, False)
-        net.setInput(blob)
-        detections = net.forward()
-        bboxes = []
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > conf_threshold:
-                x1 = int(detections[0, 0, i, 3] * frameWidth)
-                y1 = int(detections[0, 0, i, 4] * frameHeight)
-                x2 = int(detections[0, 0, i, 5] * frameWidth)
-                y2 = int(detections[0, 0, i, 6] * frameHeight)
-                bboxes.append([x1, y1, x2, y2])
-                cv2.rectangle(frameOpencvDnn, (x1, y1), (x2, y2), (0, 255, 0), int(round(frameHeight/150)), 8)
-        return frameOpencvDnn, bboxes
-    except Exception as e:
-        print(f"Error in face detection: {e}")
-        return frame, []
-
-def check_coverage(frame, grid_rows=3, grid_cols=3, variance_threshold=100.0):
+        while True:
+            sequence, frame_bytes, _ = camera.wait_for_frame(sequence, quality=quality, width=width)
+            if frame_bytes is None:
+                if not camera.running:
+                    break
+                continue
+            yield MJPEG_PART_HEADER
+            yield frame_bytes
+            yield b'\r\n'
+    finally:
+        camera.metrics.viewer_disconnected()
+
+def generate_detection_events(cam_id=None, changes_only=True, heartbeat=15.0):
+    """
+    Server-Sent Events stream of detection results. Each client only ever
+    receives the newest result, so a slow client skips intermediate frames
+    instead of queueing them. With changes_only, unchanged results are not
+    re-sent; a comment line keeps idle connections open.
+    """
+    camera = get_camera(cam_id)
+    sequence = 0
+    last_sent = None
+    last_write = time.monotonic()
+    while True:
+        sequence, info = camera.wait_for_info(sequence)
+        if info is None and not camera.running:
+            break
+        if info is not None and not (changes_only and info == last_sent):
+            last_sent = info
+            last_write = time.monotonic()
+            yield f"id: {sequence}\ndata: {json.dumps(info)}\n\n"
+        elif time.monotonic() - last_write >= heartbeat:
+            last_write = time.monotonic()
+            yield ": heartbeat\n\n"
+
+def warm_up():
+    """
+    Load the nets, run one forward pass of each on a blank frame and start
+    the default camera's pipeline, so detection, alerts, recording and
+    history run from boot and the first viewer does not pay the cold-start
+    cost. Worker cameras load and warm up in their own processes once
+    started.
+    """
+    start = time.perf_counter()
     try:
-        height, width = frame.shape[:2]
-        cell_height = height // grid_rows
-        cell_width = width // grid_cols
-        covered_cells = 0
-        total_cells = grid_rows * grid_cols
-        
-        for i in range(grid_rows):
-            for j in range(grid_cols):
-                y1 = i * cell_height
-                y2 = (i + 1) * cell_height if i < grid_rows - 1 else height
-                x1 = j * cell_width
-                x2 = (j + 1) * cell_width if j < grid_cols - 1 else width
-                cell = frame[y1:y2, x1:x2]
-                gray = cv2.cvtColor(cell, cv2.COLOR_BGR2GRAY)
-                laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-                var = laplacian.var()
-                if var < variance_threshold:
-                    covered_cells += 1
-        
-        return covered_cells / total_cells
+        if camera_registry:
+            for cam_id in camera_registry.ids():
+                camera_registry.get(cam_id)
+        elif FRAME_BUS:
+            get_camera()
+        else:
+            faceNet, genderNet = get_nets()
+            frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            detect_faces(faceNet, frame)
+            classify_genders(genderNet, frame, [[0, 0, 100, 100]], padding)
+            # Load the nets of every inference thread too
+            pool = get_processor().pool
+            if pool is not None:
+                pool.warm_up()
+            get_camera()
+        startup_state["warmed_up"] = True
     except Exception as e:
-        print(f"Error in coverage detection: {e}")
-        return 0.0
-
-def generate_frames():
-    while True:
-        try:
-            success, frame = cap.read()
-            if not success:
-                print("Failed to grab frame")
-                break
-
-            # Process frame with face detection
-            frameFace, bboxes = getFaceBox(faceNet, frame)
-            
-            numMales = 0
-            numFemales = 0
-            numPersons = len(bboxes)
-            
-            # Process each detected face
-            for bbox in bboxes:
-                try:
-                    face = frame[max(0,bbox[1]-padding):min(bbox[3]+padding,frame.shape[0]-1),
-                               max(0,bbox[0]-padding):min(bbox[2]+padding, frame.shape[1]-1)]
-                    
-                    # Gender detection
-                    blob = cv2.dnn.blobFromImage(face, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
-                    genderNet.setInput(blob)
-                    genderPreds = genderNet.forward()
-                    gender = GENDER_LIST[genderPreds[0].argmax()]
-                    
-                    # Add gender label to frame
-                    label = f"{gender}"
-                    cv2.putText(frameFace, label, (bbox[0], bbox[1]-10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2, cv2.LINE_AA)
-                    
-                    # Update counts
-                    if gender == 'Male':
-                        numMales += 1
-                    else:
-                        numFemales += 1
-                except Exception as e:
-                    print(f"Error processing face: {e}")
-                    continue
-            
-            # Determine status
-            status = "No person detected"
-            if numPersons >= 1:
-                if numFemales == 1:
-                    if numMales >= 3:
-                        status = "Warning: Woman is surrounded by men"
-                    else:
-                        status = "Woman is alone"
-                elif numPersons >= 2:
-                    status = "Multiple persons detected"
-            
-            # Check coverage
-            coverage_ratio = check_coverage(frame)
-            coverage_status = f"Coverage: {coverage_ratio:.2f}"
-            if coverage_ratio >= 0.99:
-                coverage_status = "Warning: 100% display is covered!"
-            elif coverage_ratio >= 0.4:
-                coverage_status = "Warning: Screen covered over 40%!"
-            
-            # Add overlay text to frame
-            cv2.putText(frameFace, f"Persons: {numPersons}", (10, 30),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            cv2.putText(frameFace, f"Males: {numMales}", (10, 60),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-            cv2.putText(frameFace, f"Females: {numFemales}", (10, 90),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 2)
-            cv2.putText(frameFace, status, (10, 120),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-            cv2.putText(frameFace, coverage_status, (10, 150),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            
-            # Convert frame to JPEG
-            ret, buffer = cv2.imencode('.jpg', frameFace)
-            if not ret:
-                print("Failed to encode frame")
-                continue
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                  b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        except Exception as e:
-            print(f"Error in frame generation: {e}")
-            continue
+        startup_state["error"] = str(e)
+        print(f"Error during warm-up: {e}")
+    startup_state["warm_up_seconds"] = round(time.perf_counter() - start, 3)
+
+def is_ready():
+    if camera_registry:
+        # Each worker is ready once it has published its first frame
+        return all(camera_registry.peek(cam_id).sequence > 0 for cam_id in camera_registry.ids())
+    if FRAME_BUS:
+        return pipeline is not None and pipeline.sequence > 0
+    # In-process: the nets are warm and the first frame has been published
+    return startup_state["warmed_up"] and pipeline is not None and pipeline.sequence > 0
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -478,7 +536,7 @@ HTML_TEMPLATE = """
         </div>
 
         <div class="video-container">
-            <img id="videoStream" src="{{ url_for('video_feed') }}" alt="Video Feed">
+            <img id="videoStream" src="{{ url_for('.video_feed') }}" alt="Video Feed">
         </div>
 
         <div class="controls-container">
@@ -617,16 +675,104 @@ HTML_TEMPLATE = """
 </html>
 """
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(),
+@bp.route('/video_feed')
+@bp.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
+    try:
+        get_camera(cam_id)
+    except KeyError:
+        abort(404)
+    # Optional per-client JPEG tier, e.g. /video_feed?quality=60&width=480
+    quality = request.args.get('quality', type=int)
+    width = request.args.get('width', type=int)
+    return Response(generate_frames(cam_id, quality, width),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.errorhandler(404)
+@bp.route('/detection_info')
+@bp.route('/detection_info/<cam_id>')
+def detection_info(cam_id=None):
+    try:
+        camera = peek_camera(cam_id)
+    except KeyError:
+        abort(404)
+    if camera is None:
+        return jsonify(DEFAULT_DETECTION_INFO)
+    return jsonify(camera.get_info())
+
+@bp.route('/detection_stream')
+@bp.route('/detection_stream/<cam_id>')
+def detection_stream(cam_id=None):
+    try:
+        get_camera(cam_id)
+    except KeyError:
+        abort(404)
+    changes_only = request.args.get('changes_only', '1') != '0'
+    response = Response(generate_detection_events(cam_id, changes_only), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/alerts')
+@bp.route('/alerts/<cam_id>')
+def alerts(cam_id=None):
+    """Recent alert events of a camera, newest first, e.g. /alerts?limit=20"""
+    try:
+        camera = peek_camera(cam_id)
+    except KeyError:
+        abort(404)
+    if camera is None:
+        return jsonify([])
+    if camera.alerts is None:
+        # Frame bus workers only see the producer's active alerts
+        return jsonify(camera.get_info().get("alerts", []))
+    return jsonify(camera.alerts.recent(request.args.get('limit', type=int)))
+
+@bp.route('/history')
+@bp.route('/history/<cam_id>')
+def history(cam_id=None):
+    """
+    Detection history of a camera, e.g. /history?from=1700000000&to=1700003600&step=60.
+    With FRAME_BUS each worker records its own history from the frames it
+    reads, so it only reaches back to that worker's start.
+    """
+    try:
+        camera = peek_camera(cam_id)
+    except KeyError:
+        abort(404)
+    # Nothing has been recorded before the camera starts
+    history = camera.history if camera is not None else DetectionHistory(max_frames=1)
+    try:
+        return jsonify(history.query(request.args.get('from', type=float),
+                                     request.args.get('to', type=float),
+                                     request.args.get('step', type=float)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/cameras')
+def cameras():
+    return jsonify(camera_registry.ids() or [DEFAULT_CAMERA_ID])
+
+@bp.route('/health')
+def health():
+    """Liveness: the process is up and serving requests, plus each camera's inference backend"""
+    dnn = {camera: m.dnn_config for camera, m in list(REGISTRY.cameras.items()) if m.dnn_config}
+    return jsonify({"status": "ok", "dnn": dnn})
+
+@bp.route('/ready')
+def ready():
+    """Readiness: 200 once the nets are warm and the first frame is published, 503 before"""
+    state = dict(startup_state, ready=is_ready())
+    return jsonify(state), 200 if state["ready"] else 503
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template_string("""
         <div style="text-align: center; padding: 50px;">
@@ -636,7 +782,7 @@ def not_found_error(error):
         </div>
     """), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return render_template_string("""
         <div style="text-align: center; padding: 50px;">
@@ -648,14 +794,33 @@ def internal_error(error):
 
 def cleanup():
     print("Cleaning up resources...")
+    if pipeline is not None:
+        pipeline.stop()
+    camera_registry.stop_all()
     if cap is not None:
         cap.release()
 
 import atexit
 atexit.register(cleanup)
 
+def create_app(warm_up_models=False):
+    """
+    Build the Flask app. This never opens the camera or loads the nets; they
+    are created on first use, or in a background thread if warm_up_models is
+    set, e.g. gunicorn "stream_server:create_app(warm_up_models=True)".
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    if warm_up_models:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    return flask_app
+
+# Module level app for Vercel and `gunicorn stream_server:app`; warms up lazily
+app = create_app()
+
 if __name__ == '__main__':
     try:
+        app = create_app(warm_up_models=True)
         # Vercel requires port 3000
         port = int(os.environ.get('PORT', 3000))
         app.run(host='0.0.0.0', port=port, debug=DEBUG)
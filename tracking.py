@@ -0,0 +1,285 @@
+import cv2
+import itertools
+import time
+import numpy as np
+from detection import classify_genders, MAX_GENDER_BATCH
+from inference import InferencePool
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Return the pairwise IoU of two sets of x1, y1, x2, y2 boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+class FaceTrack:
+    def __init__(self, track_id, bbox):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.missed = 0
+        self.gender = None
+        self.classified_bbox = None
+        self.classified_at = 0.0
+        self.votes = {}
+
+    def record_gender(self, gender, bbox, now):
+        self.classified_bbox = bbox
+        self.classified_at = now
+        self.votes[gender] = self.votes.get(gender, 0) + 1
+        # Report the majority vote so one bad classification does not flip the label
+        self.gender = max(self.votes, key=self.votes.get)
+
+
+class FaceTracker:
+    """
+    IoU tracker that gives detected faces stable track IDs and caches their
+    gender. A face is only re-classified when its track is new, its box has
+    moved or resized too much since the last classification, or gender_ttl
+    seconds have passed.
+    """
+
+    def __init__(self, match_iou=0.3, reclassify_iou=0.5, gender_ttl=2.0, max_missed=5):
+        self.match_iou = match_iou
+        self.reclassify_iou = reclassify_iou
+        self.gender_ttl = gender_ttl
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = itertools.count(1)
+        # Gender net forward passes made by the last classify() call
+        self.forward_calls = 0
+
+    def update(self, bboxes):
+        """Match bboxes to existing tracks and return one track per bbox"""
+        matched = [None] * len(bboxes)
+        unmatched_tracks = set(range(len(self.tracks)))
+        if self.tracks and len(bboxes):
+            ious = iou_matrix(bboxes, [track.bbox for track in self.tracks])
+            # Greedy assignment, best overlaps first
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                i, j = np.unravel_index(flat, ious.shape)
+                if ious[i, j] < self.match_iou:
+                    break
+                if matched[i] is None and j in unmatched_tracks:
+                    matched[i] = self.tracks[j]
+                    unmatched_tracks.discard(j)
+
+        for j in unmatched_tracks:
+            self.tracks[j].missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for i, bbox in enumerate(bboxes):
+            if matched[i] is None:
+                matched[i] = FaceTrack(next(self.next_id), bbox)
+                self.tracks.append(matched[i])
+            matched[i].bbox = bbox
+            matched[i].missed = 0
+        return matched
+
+    def needs_classification(self, track, now):
+        if track.gender is None:
+            return True
+        if now - track.classified_at >= self.gender_ttl:
+            return True
+        return iou_matrix([track.bbox], [track.classified_bbox])[0, 0] < self.reclassify_iou
+
+    def classify(self, net, frame, bboxes, padding=20, max_batch_size=MAX_GENDER_BATCH, now=None,
+                 buffers=None):
+        """
+        Return one gender label per bbox, running the gender net only for the
+        faces whose cached result is missing or stale. net is the gender net
+        or an InferencePool, which spreads the batches over its threads.
+        buffers (a FrameBuffers) is used for the blob when net is a single net.
+        """
+        now = time.monotonic() if now is None else now
+        tracks = self.update(bboxes)
+        stale = [i for i, track in enumerate(tracks) if self.needs_classification(track, now)]
+        if isinstance(net, InferencePool):
+            max_batch_size = net.gender_batch_size(len(stale), max_batch_size)
+            classify = net.classify_genders
+        else:
+            classify = lambda *args: classify_genders(net, *args, buffers=buffers)
+        self.forward_calls = -(-len(stale) // max(1, int(max_batch_size)))
+        if stale:
+            genders = classify(frame, [bboxes[i] for i in stale], padding, max_batch_size)
+            for i, gender in zip(stale, genders):
+                if gender is not None:
+                    tracks[i].record_gender(gender, bboxes[i], now)
+        return [track.gender for track in tracks]
+
+    def reset(self):
+        self.tracks = []
+
+
+class KeyframeDetector:
+    """
+    Runs the full face detector only on keyframes and moves the previous
+    boxes with Lucas-Kanade optical flow on the frames in between.
+
+    A keyframe is forced every `interval` frames, when the scene changes
+    (mean absolute difference of a small grayscale thumbnail above
+    scene_change_threshold) or when flow loses a box. With adaptive=True the
+    interval follows the measured detection time so that detection uses
+    roughly one frame's budget at target_fps. With buffers (a FrameBuffers),
+    the grayscale frames and thumbnails alternate between two reused pairs
+    of arrays, so the previous frame stays intact while the next one is
+    converted.
+    """
+
+    def __init__(self, detect, interval=5, adaptive=False, max_interval=15, target_fps=25.0,
+                 scene_change_threshold=25.0, buffers=None):
+        self.detect = detect
+        self.buffers = buffers
+        self.parity = 0
+        self.interval = max(1, int(interval))
+        self.adaptive = adaptive
+        self.max_interval = max_interval
+        self.target_fps = target_fps
+        self.scene_change_threshold = scene_change_threshold
+        self.detect_time = None
+        self.frames_since_detection = 0
+        self.prev_gray = None
+        self.prev_thumb = None
+        self.bboxes = []
+
+    def reset(self):
+        """Forget the previous frame so the next one is a keyframe"""
+        self.frames_since_detection = 0
+        self.prev_gray = None
+        self.prev_thumb = None
+        self.bboxes = []
+
+    def _adapt_interval(self, elapsed):
+        self.detect_time = elapsed if self.detect_time is None else 0.8 * self.detect_time + 0.2 * elapsed
+        if self.adaptive:
+            self.interval = int(min(self.max_interval, max(1, round(self.detect_time * self.target_fps))))
+
+    def _scene_changed(self, thumb):
+        if self.prev_thumb is None:
+            return True
+        return cv2.norm(thumb, self.prev_thumb, cv2.NORM_L1) / thumb.size > self.scene_change_threshold
+
+    def _buffer(self, name, shape):
+        """Reused array for this frame, or None to let OpenCV allocate one"""
+        if self.buffers is None:
+            return None
+        return self.buffers.get(f"keyframe_{name}_{self.parity}", shape, np.uint8)
+
+    def _propagate(self, gray):
+        """Shift every box by the median flow of the corners found inside it"""
+        height, width = gray.shape[:2]
+        bboxes = []
+        for x1, y1, x2, y2 in self.bboxes:
+            roi = self.prev_gray[y1:y2, x1:x2]
+            if roi.size == 0:
+                return None
+            points = cv2.goodFeaturesToTrack(roi, maxCorners=20, qualityLevel=0.01, minDistance=3)
+            if points is None or len(points) < 3:
+                return None
+            points = points + np.array([x1, y1], dtype=np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None,
+                                                        winSize=(15, 15), maxLevel=2)
+            good = status.ravel() == 1
+            if good.sum() < 3:
+                return None
+            dx, dy = np.median((moved - points)[good].reshape(-1, 2), axis=0)
+            dx, dy = int(round(float(dx))), int(round(float(dy)))
+            box = [min(max(x1 + dx, 0), width - 1), min(max(y1 + dy, 0), height - 1),
+                   min(max(x2 + dx, 0), width - 1), min(max(y2 + dy, 0), height - 1)]
+            if box[2] <= box[0] or box[3] <= box[1]:
+                return None
+            bboxes.append(box)
+        return bboxes
+
+    def __call__(self, frame):
+        """Return the face boxes for this frame"""
+        if self.interval == 1 and not self.adaptive:
+            # Every frame is a keyframe, so nothing is ever propagated
+            start = time.perf_counter()
+            self.bboxes = [list(bbox) for bbox in self.detect(frame)]
+            self._adapt_interval(time.perf_counter() - start)
+            return self.bboxes
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._buffer("gray", frame.shape[:2]))
+        thumb = cv2.resize(gray, (64, 48), dst=self._buffer("thumb", (48, 64)), interpolation=cv2.INTER_AREA)
+        self.parity ^= 1
+        bboxes = None
+        # A new resolution (e.g. another source) always gets a keyframe
+        if (self.interval > 1 and self.frames_since_detection < self.interval
+                and self.prev_gray is not None and self.prev_gray.shape == gray.shape
+                and not self._scene_changed(thumb)):
+            bboxes = self._propagate(gray) if self.bboxes else []
+        if bboxes is None:
+            start = time.perf_counter()
+            bboxes = [list(bbox) for bbox in self.detect(frame)]
+            self._adapt_interval(time.perf_counter() - start)
+            self.frames_since_detection = 0
+        self.frames_since_detection += 1
+        self.prev_gray = gray
+        self.prev_thumb = thumb
+        self.bboxes = bboxes
+        return bboxes
+
+
+class MotionGate:
+    """
+    Cheap check for whether a frame is worth running the nets on. The frame
+    is shrunk to a small blurred grayscale thumbnail and compared with a
+    running-average background; if fewer than `sensitivity` (a fraction) of
+    its pixels differ by more than pixel_threshold, nothing has moved. A
+    frame is let through at least every `heartbeat` seconds regardless, so
+    a person standing still is re-checked periodically. With buffers (a
+    FrameBuffers), the thumbnails are written into reused arrays.
+    """
+
+    def __init__(self, sensitivity=0.005, heartbeat=2.0, pixel_threshold=25, size=(160, 120),
+                 learning_rate=0.05, buffers=None):
+        self.buffers = buffers
+        self.sensitivity = sensitivity
+        self.heartbeat = heartbeat
+        self.pixel_threshold = pixel_threshold
+        self.size = size
+        self.learning_rate = learning_rate
+        self.background = None
+        self.last_pass = None
+        self.motion = 0.0
+
+    def __call__(self, frame, now=None):
+        """Return True if the frame should be analyzed"""
+        now = time.monotonic() if now is None else now
+        width, height = self.size
+        thumb = cv2.resize(frame, self.size, dst=self._buffer("small", (height, width) + frame.shape[2:]),
+                           interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY, dst=self._buffer("gray", (height, width)))
+        thumb = cv2.GaussianBlur(thumb, (5, 5), 0, dst=self._buffer("blurred", (height, width)))
+        if self.background is None:
+            self.background = thumb.astype(np.float32)
+            self.motion = 1.0
+        else:
+            background = cv2.convertScaleAbs(self.background, dst=self._buffer("background", (height, width)))
+            diff = cv2.absdiff(thumb, background, dst=self._buffer("diff", (height, width)))
+            cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            self.motion = cv2.countNonZero(diff) / diff.size
+            cv2.accumulateWeighted(thumb, self.background, self.learning_rate)
+        if (self.motion >= self.sensitivity or self.last_pass is None
+                or now - self.last_pass >= self.heartbeat):
+            self.last_pass = now
+            return True
+        return False
+
+    def _buffer(self, name, shape):
+        """Reused array, or None to let OpenCV allocate one"""
+        if self.buffers is None:
+            return None
+        return self.buffers.get(f"motion_{name}", shape, np.uint8)
+
+    def reset(self):
+        self.background = None
+        self.last_pass = None